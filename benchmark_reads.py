@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Load comparison for the read endpoints.
+Fires concurrent GET requests at a running server and reports throughput and
+latency, e.g. to compare the async read path against a build of the sync one
+at the same worker count.
+Usage: uv run python benchmark_reads.py --base-url http://localhost:8000 --concurrency 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+DEFAULT_PATHS = [
+    "/api/v1/posts/?limit=20",
+    "/api/v1/posts/sync?since=",
+    "/api/v1/posts/1",
+    "/api/v1/posts/1/comments",
+]
+
+
+async def run(base_url: str, paths, concurrency: int, total: int, token: str = None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"Requests:     {total} ({errors} errors) at concurrency {concurrency}")
+    print(f"Throughput:   {total / elapsed:.1f} req/s")
+    print(f"Latency p50:  {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"Latency p95:  {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"Latency max:  {latencies[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--token", help="Bearer token, to bypass the anonymous response cache")
+    parser.add_argument("paths", nargs="*", default=DEFAULT_PATHS)
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.paths, args.concurrency, args.requests, args.token))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Script to migrate the post table to add missing columns and indexes.
+This will preserve existing data; every statement is safe to re-run.
+Works on both PostgreSQL and SQLite.
+Usage: uv run python migrate_post_table.py
+"""
+from sqlmodel import Session, text
+from cj36.dependencies import engine
+from cj36.core.search import ensure_search_index
+
+def migrate_post_table():
+    """Add missing columns and indexes to the post table."""
+    print("=" * 60)
+    print("Migrating Post Table Schema")
+    print("=" * 60)
+    print()
+
+    migrations = [
+        # Keyset pagination index for the newest-first feed
+        """
+        CREATE INDEX IF NOT EXISTS ix_post_created_at_id ON post (created_at, id);
+        """,
+
+        # Delta sync index (changes since a last_modified watermark)
+        """
+        CREATE INDEX IF NOT EXISTS ix_post_last_modified_id ON post (last_modified, id);
+        """,
+
+        # Full-text search tokens (fails harmlessly if the column already exists)
+        """
+        ALTER TABLE post ADD COLUMN search_text TEXT;
+        """,
+
+        # Full-text search GIN index (PostgreSQL only; SQLite uses an FTS5 table)
+        """
+        CREATE INDEX IF NOT EXISTS ix_post_search_text_fts ON post
+        USING gin (to_tsvector('simple', search_text));
+        """,
+
+        # Resized image variants (fails harmlessly if the column already exists)
+        """
+        ALTER TABLE post ADD COLUMN image_variants JSON;
+        """,
+
+        # Posts sharing a content-addressed upload
+        """
+        CREATE INDEX IF NOT EXISTS ix_post_image ON post (image);
+        """,
+
+        # Due scheduled posts, published with one UPDATE
+        """
+        CREATE INDEX IF NOT EXISTS ix_post_status_scheduled_at ON post (status, scheduled_at);
+        """,
+
+        # Denormalized comment count (fails harmlessly if the column already exists)
+        """
+        ALTER TABLE post ADD COLUMN comments_count INTEGER NOT NULL DEFAULT 0;
+        """,
+
+        # Backfill comment counts; later kept up to date on every comment write
+        """
+        UPDATE post SET comments_count = (
+            SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id
+        );
+        """,
+
+        # A post's comments in keyset pages
+        """
+        CREATE INDEX IF NOT EXISTS ix_comment_post_id_created_at_id ON comment (post_id, created_at, id);
+        """,
+
+        # Drop duplicate bookmarks (keeping the oldest) so the unique index below can be built
+        """
+        DELETE FROM bookmark WHERE id NOT IN (
+            SELECT MIN(id) FROM bookmark GROUP BY user_id, post_id
+        );
+        """,
+
+        # One bookmark per user and post; bookmark sync relies on it for ON CONFLICT
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_bookmark_user_id_post_id ON bookmark (user_id, post_id);
+        """,
+
+        # When a post last left PUBLISHED (fails harmlessly if the column already exists)
+        """
+        ALTER TABLE post ADD COLUMN unpublished_at TIMESTAMP;
+        """,
+
+        # Who may learn about a deletion (fail harmlessly if the columns already exist);
+        # older tombstones keep being reported to everyone
+        """
+        ALTER TABLE posttombstone ADD COLUMN was_published BOOLEAN NOT NULL DEFAULT TRUE;
+        """,
+        """
+        ALTER TABLE posttombstone ADD COLUMN author_id INTEGER;
+        """,
+    ]
+
+    try:
+        with Session(engine) as session:
+            print("🔄 Applying migrations...")
+            print()
+
+            for i, migration in enumerate(migrations, 1):
+                try:
+                    session.exec(text(migration))
+                    session.commit()
+                    print(f"✅ Migration {i}/{len(migrations)} completed")
+                except Exception as e:
+                    print(f"⚠️  Migration {i}/{len(migrations)} skipped or failed: {e}")
+                    session.rollback()
+
+            print()
+            print("🔄 Indexing posts for search...")
+            ensure_search_index(session)
+
+            print()
+            print("=" * 60)
+            print("✅ Migration completed!")
+            print("=" * 60)
+
+    except Exception as e:
+        print(f"\n❌ Migration failed: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    migrate_post_table()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Write precompressed .gz (and .br, with the brotli package installed) siblings
+for the compressible files under static/, which /static then serves directly.
+Safe to re-run; only missing or outdated siblings are written.
+Usage: uv run python precompress_static.py [directory]
+"""
+import sys
+from pathlib import Path
+from cj36.core.static_files import precompress
+
+
+def main():
+    directory = Path(sys.argv[1] if len(sys.argv) > 1 else "static")
+    written = precompress(directory)
+    for path in written:
+        print(f"✅ {path}")
+    print(f"Precompressed {len(written)} file(s) under {directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,34 @@
+import datetime
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status, Body
+from sqlalchemy import literal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select
-from cj36.dependencies import get_db, get_current_user
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cj36.dependencies import get_db, get_async_read_db, get_current_user, get_current_user_async
 from cj36.models import Bookmark, BookmarkCreate, BookmarkRead, User, Post
+from cj36.core.sql import upsert_insert
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[BookmarkRead])
-def get_user_bookmarks(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def get_user_bookmarks(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     """Get all bookmarks for the current user"""
-    bookmarks = db.exec(
+    bookmarks = (await db.exec(
         select(Bookmark)
         .where(Bookmark.user_id == current_user.id)
         .order_by(Bookmark.created_at.desc())
-    ).all()
+        .options(
+            selectinload(Bookmark.post).selectinload(Post.author),
+            selectinload(Bookmark.post).selectinload(Post.category),
+            selectinload(Bookmark.post).selectinload(Post.topics),
+        )
+    )).all()
     return bookmarks
 
 
@@ -49,7 +60,16 @@ def add_bookmark(
         user_id=current_user.id
     )
     db.add(bookmark)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request bookmarked it first (unique user_id, post_id)
+        db.rollback()
+        return db.exec(
+            select(Bookmark)
+            .where(Bookmark.user_id == current_user.id)
+            .where(Bookmark.post_id == bookmark_in.post_id)
+        ).one()
     db.refresh(bookmark)
     return bookmark
 
@@ -81,29 +101,36 @@ def sync_bookmarks(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Sync local bookmarks to server"""
+    """
+    Merge a device's local bookmarks into the server's.
+    Returns the merged set (`post_ids`) and the requested posts that no longer
+    exist (`missing_ids`), so the client can reconcile in one round trip.
+    """
+    requested = set(post_ids)
     synced_count = 0
-    
-    for post_id in post_ids:
-        # Check if post exists
-        post = db.get(Post, post_id)
-        if not post:
-            continue
-        
-        # Check if already bookmarked
-        existing = db.exec(
-            select(Bookmark)
-            .where(Bookmark.user_id == current_user.id)
-            .where(Bookmark.post_id == post_id)
-        ).first()
-        
-        if not existing:
-            bookmark = Bookmark(
-                post_id=post_id,
-                user_id=current_user.id
-            )
-            db.add(bookmark)
-            synced_count += 1
-    
+    if requested:
+        bookmarks = Bookmark.__table__
+        # One INSERT ... SELECT: ids without a post are filtered out by the join,
+        # ones already bookmarked by the unique (user_id, post_id) index
+        rows = select(literal(current_user.id), Post.id, literal(datetime.datetime.utcnow())).where(
+            Post.id.in_(requested)
+        )
+        columns = [bookmarks.c.user_id, bookmarks.c.post_id, bookmarks.c.created_at]
+        try:
+            stmt = upsert_insert(db.get_bind().dialect.name, bookmarks).from_select(columns, rows)
+            synced_count = db.execute(
+                stmt.on_conflict_do_nothing(index_elements=[bookmarks.c.user_id, bookmarks.c.post_id])
+            ).rowcount
+        except NotImplementedError:
+            existing = select(Bookmark.post_id).where(Bookmark.user_id == current_user.id)
+            synced_count = db.execute(
+                bookmarks.insert().from_select(columns, rows.where(Post.id.not_in(existing)))
+            ).rowcount
+
+    merged = db.exec(select(Bookmark.post_id).where(Bookmark.user_id == current_user.id)).all()
     db.commit()
-    return {"message": f"Synced {synced_count} bookmarks"}
+    return {
+        "message": f"Synced {synced_count} bookmarks",
+        "post_ids": sorted(merged),
+        "missing_ids": sorted(requested.difference(merged)),
+    }
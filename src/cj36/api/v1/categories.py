@@ -1,16 +1,22 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import TypeAdapter
 from sqlmodel import Session
 from cj36.dependencies import (
     get_db,
+    get_read_db,
     get_current_user,
     AdminChecker,
     get_optional_current_user,
 )
-from cj36.models import Category, CategoryCreate, CategoryRead, User
+from cj36.models import Category, CategoryCreate, CategoryRead, CategoryTreeResponse, User
+from cj36.core.etag import json_response
+from cj36.core.category_tree import category_tree
 
 router = APIRouter()
 
+CATEGORY_LIST_ADAPTER = TypeAdapter(List[CategoryRead])
+
 
 @router.post("/", response_model=CategoryRead)
 def create_category(
@@ -27,25 +33,42 @@ def create_category(
 
 @router.get("/", response_model=List[CategoryRead])
 def read_categories(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: Optional[User] = Depends(get_optional_current_user),
 ):
     categories = db.query(Category).offset(skip).limit(limit).all()
-    return categories
+    body = CATEGORY_LIST_ADAPTER.dump_json(CATEGORY_LIST_ADAPTER.validate_python(categories, from_attributes=True))
+    return json_response(request, body)
+
+
+@router.get("/tree", response_model=CategoryTreeResponse)
+def read_category_tree(
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Every category nested under its parent, with published post counts.
+    Served from memory; `version` changes whenever the tree does.
+    Reloads read the primary so a category write is never cached stale.
+    """
+    body, headers = category_tree.tree_response(db)
+    return json_response(request, body, headers)
 
 
 @router.get("/{category_id}", response_model=CategoryRead)
 def read_category(
+    request: Request,
     category_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: Optional[User] = Depends(get_optional_current_user),
 ):
     db_category = db.get(Category, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
-    return db_category
+    return json_response(request, CategoryRead.model_validate(db_category).model_dump_json().encode())
 
 
 @router.put("/{category_id}", response_model=CategoryRead)
@@ -59,6 +82,8 @@ def update_category(
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     category_data = category.dict(exclude_unset=True)
+    if category_tree.creates_cycle(db, category_id, category_data.get("parent_id")):
+        raise HTTPException(status_code=400, detail="A category cannot be nested under itself or its subcategories")
     for key, value in category_data.items():
         setattr(db_category, key, value)
     db.add(db_category)
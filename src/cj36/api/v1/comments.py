@@ -1,21 +1,46 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import tuple_
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select
-from cj36.dependencies import get_db, get_current_user, get_optional_current_user
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cj36.dependencies import get_db, get_async_read_db, get_current_user, get_optional_current_user
 from cj36.models import Comment, CommentCreate, CommentRead, User, Post, UserType, AdminType
+from cj36.core.pagination import encode_cursor, decode_cursor
 
 router = APIRouter()
 
 
 @router.get("/{post_id}/comments", response_model=List[CommentRead])
-def get_post_comments(
+async def get_post_comments(
     post_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    """Get all comments for a post"""
-    comments = db.exec(
-        select(Comment).where(Comment.post_id == post_id).order_by(Comment.created_at.desc())
-    ).all()
+    """
+    Comments of a post, newest first, `limit` per page.
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
+    """
+    # Authors of the whole page come from one batched SELECT ... IN; there is
+    # no lazy loading on the async path
+    query = (
+        select(Comment)
+        .where(Comment.post_id == post_id)
+        .order_by(Comment.created_at.desc(), Comment.id.desc())
+        .options(selectinload(Comment.author))
+    )
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(Comment.created_at, Comment.id) < (cursor_created_at, cursor_id))
+
+    comments = (await db.exec(query.limit(limit))).all()
+    if len(comments) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(comments[-1].created_at, comments[-1].id)
     return comments
 
 
@@ -41,7 +66,7 @@ def create_comment(
     db.add(comment)
     db.commit()
     db.refresh(comment)
-    return comment
+    return CommentRead(**comment.model_dump(), author=current_user)
 
 
 @router.delete("/comments/{comment_id}")
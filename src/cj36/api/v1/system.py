@@ -3,7 +3,12 @@ from sqlmodel import Session
 from sqlalchemy import text
 import psutil
 
-from cj36.dependencies import get_db
+from cj36.dependencies import get_db, engine, async_engine
+from cj36.core.db_pool import pool_status
+from cj36.core.replicas import replica_router
+from cj36.core.password_hashing import hashing_pool
+from cj36.core.cache import feed_cache
+from cj36.core.post_stream import post_change_feed
 
 router = APIRouter()
 
@@ -50,3 +55,39 @@ def get_all_routes(request: Request):
                 }
             )
     return routes
+
+
+@router.get("/cache")
+def get_cache_stats():
+    """
+    Hit/miss counters of the anonymous feed response cache (this worker only).
+    """
+    return {"feed_cache": feed_cache.stats()}
+
+
+@router.get("/db-pool")
+def get_db_pool_stats():
+    """
+    Connection pool usage and checkout wait times of both engines (this worker only).
+    """
+    return {
+        "sync": pool_status(engine),
+        "async": pool_status(async_engine),
+        "replicas": replica_router.status(),
+    }
+
+
+@router.get("/password-hashing")
+def get_password_hashing_stats():
+    """
+    Load, queue wait and rejections of the password hashing pool (this worker only).
+    """
+    return hashing_pool.stats()
+
+
+@router.get("/post-stream")
+def get_post_stream_stats():
+    """
+    Connected clients and delivery counters of /posts/stream (this worker only).
+    """
+    return post_change_feed.stats()
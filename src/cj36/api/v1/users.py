@@ -4,13 +4,18 @@ from datetime import timedelta
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Body
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session
-from cj36.core.security import create_access_token, get_password_hash, verify_password
-from cj36.core.email import send_verification_email
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cj36.core.security import create_access_token
+from cj36.core.password_hashing import check_password, hash_password
+from cj36.core.email import queue_verification_email
 from cj36.dependencies import (
     get_current_user,
+    get_current_user_async,
     get_db,
+    get_async_db,
     AdminChecker,
+    AsyncAdminChecker,
 )
 from cj36.models import (
     User,
@@ -24,18 +29,21 @@ from cj36.models import (
 
 router = APIRouter()
 
+# Endpoints that hash passwords are async: waiting on bcrypt (in the hashing
+# pool) must not hold one of the threadpool workers that serve sync endpoints.
+
 # ---------- Signup (subscriber) ----------
 @router.post("/signup", response_model=UserRead)
-def signup_user(
-    user: UserSignup, db: Session = Depends(get_db)
+async def signup_user(
+    user: UserSignup, db: AsyncSession = Depends(get_async_db)
 ):
     # Ensure username/email uniqueness
-    if db.query(User).filter(User.username == user.username).first():
+    if (await db.exec(select(User).where(User.username == user.username))).first():
         raise HTTPException(status_code=400, detail="Username already registered")
-    if db.query(User).filter(User.email == user.email).first():
+    if (await db.exec(select(User).where(User.email == user.email))).first():
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     verification_code = ''.join(random.choices(string.digits, k=6))
     
     db_user = User(
@@ -49,11 +57,10 @@ def signup_user(
         verification_code=verification_code
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    # Send verification email
-    send_verification_email(db_user.email, verification_code)
+    # Queued in the same transaction; sent in the background after commit
+    queue_verification_email(db, db_user.email, verification_code)
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
@@ -108,12 +115,11 @@ def resend_verification(
     verification_code = ''.join(random.choices(string.digits, k=6))
     user.verification_code = verification_code
     db.add(user)
+    queue_verification_email(db, user.email, verification_code)
     db.commit()
-    
-    send_verification_email(user.email, verification_code)
     return {"message": "Verification code sent"}
 
-from cj36.core.email import send_password_reset_email
+from cj36.core.email import queue_password_reset_email
 
 @router.post("/reset-password-request")
 def request_password_reset(
@@ -123,39 +129,40 @@ def request_password_reset(
     verification_code = ''.join(random.choices(string.digits, k=6))
     current_user.verification_code = verification_code
     db.add(current_user)
+    queue_password_reset_email(db, current_user.email, verification_code)
     db.commit()
-    
-    send_password_reset_email(current_user.email, verification_code)
     return {"message": "Password reset OTP sent"}
 
 @router.post("/reset-password-confirm")
-def confirm_password_reset(
+async def confirm_password_reset(
     code: str = Body(...),
     new_password: str = Body(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if current_user.verification_code != code:
+    # The row, not the cached snapshot: the OTP may have been issued by another worker
+    user = await db.get(User, current_user.id)
+    if user is None or user.verification_code != code:
         raise HTTPException(status_code=400, detail="Invalid OTP")
         
-    current_user.hashed_password = get_password_hash(new_password)
-    current_user.verification_code = None
-    db.add(current_user)
-    db.commit()
+    user.hashed_password = await hash_password(new_password)
+    user.verification_code = None
+    db.add(user)
+    await db.commit()
     
     return {"message": "Password updated successfully"}
 
 # ---------- Admin/User management (admin only) ----------
 @router.post("/", response_model=UserRead)
-def create_user(
+async def create_user(
     user: UserCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(AdminChecker(["admin"])),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(AsyncAdminChecker(["admin"])),
 ):
     # Only admins can create other admins or maintainers; writers can be created by admins as well
-    if db.query(User).filter(User.username == user.username).first():
+    if (await db.exec(select(User).where(User.username == user.username))).first():
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     db_user = User(
         username=user.username,
         email=getattr(user, "email", None),
@@ -167,8 +174,8 @@ def create_user(
         newsletter_subscribed=getattr(user, "newsletter_subscribed", False),
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.get("/", response_model=List[UserRead])
@@ -249,13 +256,13 @@ def read_user(
     return user
 
 @router.patch("/{user_id}", response_model=UserRead)
-def update_user(
+async def update_user(
     user_id: int,
     user_in: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(AdminChecker(["admin", "maintainer"])),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(AsyncAdminChecker(["admin", "maintainer"])),
 ):
-    user = db.get(User, user_id)
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -283,13 +290,13 @@ def update_user(
 
     user_data = user_in.dict(exclude_unset=True)
     if "password" in user_data:
-        user_data["hashed_password"] = get_password_hash(user_data["password"])
+        user_data["hashed_password"] = await hash_password(user_data["password"])
         del user_data["password"]
     for key, value in user_data.items():
         setattr(user, key, value)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 @router.delete("/{user_id}", response_model=UserRead)
@@ -306,16 +313,26 @@ def delete_user(
     return user
 
 @router.post("/token")
-def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # Async so waiting on bcrypt (in the hashing pool) holds no threadpool worker
+    user = (await db.exec(select(User).where(User.username == form_data.username))).first()
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await check_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    if new_hash:
+        # Stored with outdated bcrypt parameters; upgrade while we have the password
+        user.hashed_password = new_hash
+        db.add(user)
+        await db.commit()
         
     if not user.is_verified:
         raise HTTPException(
@@ -0,0 +1,122 @@
+"""
+In-process caches.
+
+``feed_cache`` holds serialized responses of the anonymous post feeds. It is
+cleared whenever a transaction that touched posts, topics or categories
+commits in this process (API writes, scheduler publishes, scripts), and its
+TTL bounds how long other worker processes can serve an older copy.
+
+``user_cache`` maps usernames to column snapshots of their User rows so token
+authentication needs no query. It is cleared whenever a transaction that
+updated or deleted a user commits; its short TTL bounds how long other
+workers keep accepting a user who was just blocked or deleted.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session as SASession
+from cj36.core.config import settings
+from cj36.models import Category, Post, PostCategoryLink, User
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after being stored."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by clear(); set() drops values computed before the last clear
+        self.generation = 0
+        self.cleared_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """
+        Store ``value``. Pass the ``generation`` read before computing it so a
+        value built from data that was invalidated meanwhile is not cached.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+            self.cleared_at = time.monotonic()
+            self.invalidations += 1
+
+    def seconds_since_clear(self) -> float:
+        return time.monotonic() - self.cleared_at
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+feed_cache = TTLCache(maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL)
+
+user_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+
+FEED_MODELS = (Post, PostCategoryLink, Category)
+
+
+@event.listens_for(SASession, "after_flush")
+def _mark_feed_changes(session, flush_context):
+    if any(isinstance(obj, FEED_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["feed_changed"] = True
+    # New users cannot be cached yet; only changes to existing ones matter
+    if any(isinstance(obj, User) for obj in (*session.dirty, *session.deleted)):
+        session.info["users_changed"] = True
+
+
+@event.listens_for(SASession, "after_commit")
+def _invalidate_feed_cache(session):
+    if session.info.pop("feed_changed", False):
+        feed_cache.clear()
+    if session.info.pop("users_changed", False):
+        user_cache.clear()
+
+
+@event.listens_for(SASession, "after_soft_rollback")
+def _discard_feed_changes(session, previous_transaction):
+    session.info.pop("feed_changed", None)
+    session.info.pop("users_changed", None)
@@ -0,0 +1,166 @@
+"""
+Incrementally maintained published-post counts per category.
+
+Every flush that creates, deletes, publishes/unpublishes or re-categorizes a
+Post adjusts the CategoryPostCount table in the same transaction, so the
+counts are a single cheap read. This covers API endpoints, the scheduler and
+maintenance scripts alike. ``reconcile_category_counts`` rebuilds the table
+from the post table and runs at startup and periodically to repair drift from
+raw SQL writes.
+"""
+import logging
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event, func, inspect, delete, insert, text
+from sqlalchemy.orm import Session as SASession
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cj36.core.sql import upsert_insert
+from cj36.models import CategoryPostCount, Post, PostCategoryLink, PostStatus
+
+logger = logging.getLogger(__name__)
+
+counts_table = CategoryPostCount.__table__
+
+
+def _counted_category(status, category_id) -> Optional[int]:
+    """The category a post in this state counts towards, if any."""
+    if status == PostStatus.PUBLISHED and category_id is not None:
+        return category_id
+    return None
+
+
+def previous_state(session: SASession, post: Post) -> Tuple[object, Optional[int]]:
+    """(status, category_id) of a persistent post as currently stored in the database."""
+    state = inspect(post)
+    values = {}
+    missing = False
+    for key in ("status", "category_id"):
+        history = state.attrs[key].history
+        if history.deleted:
+            values[key] = history.deleted[0]
+        elif history.unchanged:
+            values[key] = history.unchanged[0]
+        elif not history.added:
+            # Not loaded and not modified: the current value is the stored one
+            values[key] = getattr(post, key)
+        else:
+            # Overwritten before ever being loaded; read the old value back
+            missing = True
+    if missing:
+        row = session.connection().execute(
+            select(Post.status, Post.category_id).where(Post.id == post.id)
+        ).one()
+        values = {"status": row[0], "category_id": row[1]}
+    return PostStatus(values["status"]), values["category_id"]
+
+
+def apply_count_deltas(connection, deltas: Dict[int, int]) -> None:
+    """Add ``deltas`` ({category_id: change}) to the stored counts."""
+    for category_id, delta in deltas.items():
+        if delta == 0:
+            continue
+        try:
+            stmt = upsert_insert(connection.dialect.name, counts_table).values(
+                category_id=category_id, post_count=max(delta, 0)
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[counts_table.c.category_id],
+                set_={"post_count": counts_table.c.post_count + delta},
+            )
+            connection.execute(stmt)
+        except NotImplementedError:
+            result = connection.execute(
+                counts_table.update()
+                .where(counts_table.c.category_id == category_id)
+                .values(post_count=counts_table.c.post_count + delta)
+            )
+            if result.rowcount == 0:
+                connection.execute(
+                    insert(counts_table).values(category_id=category_id, post_count=max(delta, 0))
+                )
+
+
+@event.listens_for(SASession, "before_flush")
+def _track_post_count_changes(session, flush_context, instances):
+    deltas: Counter = Counter()
+
+    for obj in session.new:
+        if isinstance(obj, Post):
+            category_id = _counted_category(obj.status, obj.category_id)
+            if category_id is not None:
+                deltas[category_id] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Post):
+            category_id = _counted_category(*previous_state(session, obj))
+            if category_id is not None:
+                deltas[category_id] -= 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Post) or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        if not (state.attrs.status.history.added or state.attrs.category_id.history.added):
+            continue
+        before = _counted_category(*previous_state(session, obj))
+        after = _counted_category(obj.status, obj.category_id)
+        if before != after:
+            if before is not None:
+                deltas[before] -= 1
+            if after is not None:
+                deltas[after] += 1
+
+    if any(deltas.values()):
+        apply_count_deltas(session.connection(), deltas)
+        # Lets caches built from the counts refresh once this commits
+        session.info["category_counts_changed"] = True
+
+
+CATEGORY_COUNTS_QUERY = (
+    select(CategoryPostCount.category_id, CategoryPostCount.post_count)
+    .where(CategoryPostCount.post_count > 0)
+)
+
+
+def get_category_counts(session: Session) -> Dict[int, int]:
+    """Published post count per category (categories without posts are omitted)."""
+    return dict(session.exec(CATEGORY_COUNTS_QUERY).all())
+
+
+async def get_category_counts_async(session: AsyncSession) -> Dict[int, int]:
+    """get_category_counts on an AsyncSession."""
+    return dict((await session.exec(CATEGORY_COUNTS_QUERY)).all())
+
+
+def get_topic_counts(session: Session) -> Dict[int, int]:
+    """
+    Published post count per topic, from the post/topic links. Posts are filed
+    under a topic's top-level parent, so subcategories have no CategoryPostCount
+    row; the category tree aggregates these only when it is re-rendered.
+    """
+    return dict(session.exec(
+        select(PostCategoryLink.category_id, func.count(PostCategoryLink.post_id))
+        .join(Post, Post.id == PostCategoryLink.post_id)
+        .where(Post.status == PostStatus.PUBLISHED)
+        .group_by(PostCategoryLink.category_id)
+    ).all())
+
+
+def reconcile_category_counts(session: Session) -> None:
+    """Rebuild the CategoryPostCount table from the post table."""
+    if session.get_bind().dialect.name == "postgresql":
+        # Block concurrent increments until the rebuilt counts are committed
+        session.execute(text(f"LOCK TABLE {counts_table.name} IN EXCLUSIVE MODE"))
+    rows = session.exec(
+        select(Post.category_id, func.count(Post.id))
+        .where(Post.status == PostStatus.PUBLISHED, Post.category_id.is_not(None))
+        .group_by(Post.category_id)
+    ).all()
+    session.execute(delete(CategoryPostCount))
+    session.add_all(
+        CategoryPostCount(category_id=category_id, post_count=count)
+        for category_id, count in rows
+    )
+    session.commit()
+    logger.info(f"Reconciled published post counts for {len(rows)} categories")
@@ -0,0 +1,166 @@
+"""
+In-memory category tree.
+
+Categories are a small, rarely written table that every client needs in full.
+``category_tree`` keeps it in memory: the nodes are reloaded only after a
+commit that wrote categories, and the serialized /categories/tree body is
+re-rendered after categories, published post counts or post topics change.
+Top-level nodes count the posts filed under them; subcategories count the
+published posts tagged with them. Other worker
+processes pick up category writes after CATEGORY_CACHE_TTL seconds.
+
+Post writes use the same cache to validate topics and resolve their parent
+categories without querying the category table.
+
+The tree ``version`` is a checksum of its content, so it is the same on every
+worker and changes whenever the served tree does.
+"""
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from sqlalchemy.orm import Session as SASession
+from sqlmodel import Session, select
+from cj36.core.category_counts import get_category_counts, get_topic_counts
+from cj36.core.config import settings
+from cj36.core.etag import compute_etag
+from cj36.models import Category, CategoryPostCount, CategoryRead, CategoryTreeNode, PostCategoryLink
+
+NODE_LIST_ADAPTER = TypeAdapter(List[CategoryTreeNode])
+
+
+class CategoryTreeCache:
+    """Lazily loaded categories plus the pre-serialized tree response."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._categories: Optional[Dict[int, CategoryRead]] = None
+        self._loaded_at = 0.0
+        self._body: Optional[bytes] = None
+        self._headers: Dict[str, str] = {}
+
+    def invalidate(self) -> None:
+        """Drop everything; the next read reloads categories from the database."""
+        with self._lock:
+            self._categories = None
+            self._body = None
+
+    def invalidate_counts(self) -> None:
+        """Re-render the tree with fresh post counts on the next read."""
+        with self._lock:
+            self._body = None
+
+    def _ensure_loaded(self, db: Session) -> Dict[int, CategoryRead]:
+        # Caller holds the lock
+        if self._categories is None or time.monotonic() - self._loaded_at > self.ttl:
+            categories = db.exec(select(Category).order_by(Category.id)).all()
+            self._categories = {c.id: CategoryRead.model_validate(c) for c in categories}
+            self._loaded_at = time.monotonic()
+            self._body = None
+        return self._categories
+
+    def categories(self, db: Session) -> Dict[int, CategoryRead]:
+        """All categories by id."""
+        with self._lock:
+            return self._ensure_loaded(db)
+
+    def topic_parents(self, db: Session, topic_ids: List[int]) -> Dict[int, int]:
+        """
+        Map each existing topic id to the category its posts are filed under:
+        the topic's parent, or the topic itself when it is top-level. Unknown
+        ids are left out, after reloading once in case another worker just
+        created them.
+        """
+        with self._lock:
+            categories = self._ensure_loaded(db)
+            if any(topic_id not in categories for topic_id in topic_ids):
+                self._categories = None
+                categories = self._ensure_loaded(db)
+        return {
+            topic_id: categories[topic_id].parent_id or topic_id
+            for topic_id in dict.fromkeys(topic_ids)
+            if topic_id in categories
+        }
+
+    def creates_cycle(self, db: Session, category_id: int, parent_id: Optional[int]) -> bool:
+        """Whether making ``parent_id`` the parent of ``category_id`` would loop the tree."""
+        categories = self.categories(db)
+        seen = set()
+        while parent_id is not None and parent_id not in seen:
+            if parent_id == category_id:
+                return True
+            seen.add(parent_id)
+            parent = categories.get(parent_id)
+            parent_id = parent.parent_id if parent is not None else None
+        return parent_id is not None
+
+    def tree_response(self, db: Session) -> tuple:
+        """``(body, headers)`` of the serialized tree, rendering it if needed."""
+        with self._lock:
+            categories = self._ensure_loaded(db)
+            if self._body is None:
+                counts = get_category_counts(db)
+                topic_counts = get_topic_counts(db)
+                nodes = {
+                    category_id: CategoryTreeNode(
+                        **category.model_dump(),
+                        post_count=(topic_counts if category.parent_id is not None else counts).get(category_id, 0),
+                    )
+                    for category_id, category in categories.items()
+                }
+                roots = []
+                for node in nodes.values():
+                    if _in_cycle(categories, node.id):
+                        # Would nest inside itself and never serialize; written by raw SQL
+                        continue
+                    parent = nodes.get(node.parent_id) if node.parent_id is not None else None
+                    (parent.subcategories if parent is not None else roots).append(node)
+                tree = NODE_LIST_ADAPTER.dump_json(roots)
+                version = zlib.crc32(tree)
+                self._body = b'{"version":%d,"categories":%s}' % (version, tree)
+                self._headers = {"ETag": compute_etag(self._body)}
+            return self._body, self._headers
+
+
+def _in_cycle(categories: Dict[int, CategoryRead], category_id: int) -> bool:
+    """Whether the parent chain of ``category_id`` loops (through itself or an ancestor)."""
+    seen = set()
+    current = categories.get(category_id)
+    while current is not None and current.parent_id is not None:
+        if current.id in seen:
+            return True
+        seen.add(current.id)
+        current = categories.get(current.parent_id)
+    return False
+
+
+category_tree = CategoryTreeCache(ttl=settings.CATEGORY_CACHE_TTL)
+
+
+@event.listens_for(SASession, "after_flush")
+def _mark_category_changes(session, flush_context):
+    changed = (*session.new, *session.dirty, *session.deleted)
+    if any(isinstance(obj, Category) for obj in changed):
+        session.info["categories_changed"] = True
+    # Topic links feed the subcategory counts
+    if any(isinstance(obj, (CategoryPostCount, PostCategoryLink)) for obj in changed):
+        session.info["category_counts_changed"] = True
+
+
+@event.listens_for(SASession, "after_commit")
+def _invalidate_category_tree(session):
+    categories_changed = session.info.pop("categories_changed", False)
+    counts_changed = session.info.pop("category_counts_changed", False)
+    if categories_changed:
+        category_tree.invalidate()
+    elif counts_changed:
+        category_tree.invalidate_counts()
+
+
+@event.listens_for(SASession, "after_soft_rollback")
+def _discard_category_changes(session, previous_transaction):
+    session.info.pop("categories_changed", None)
+    session.info.pop("category_counts_changed", None)
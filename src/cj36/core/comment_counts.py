@@ -0,0 +1,63 @@
+"""
+Denormalized comment counts on posts.
+
+Every flush that adds or deletes a Comment adjusts ``post.comments_count`` in
+the same transaction, so feeds show counts without a COUNT per post. The
+update leaves ``last_modified`` alone: a new comment does not make the post a
+delta-sync change, and cached feeds pick the count up within their TTL.
+``reconcile_comment_counts`` recounts from the comment table and runs
+periodically to repair drift from raw SQL writes.
+"""
+from collections import Counter
+from typing import Dict
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session as SASession
+from sqlmodel import Session, select
+from cj36.models import Comment, Post
+
+posts_table = Post.__table__
+
+
+def apply_comment_deltas(connection, deltas: Dict[int, int]) -> None:
+    """Add ``deltas`` ({post_id: change}) to the stored comment counts."""
+    for post_id, delta in deltas.items():
+        if delta == 0:
+            continue
+        connection.execute(
+            update(posts_table)
+            .where(posts_table.c.id == post_id)
+            .values(
+                comments_count=posts_table.c.comments_count + delta,
+                # Suppress the onupdate bump
+                last_modified=posts_table.c.last_modified,
+            )
+        )
+
+
+@event.listens_for(SASession, "before_flush")
+def _track_comment_count_changes(session, flush_context, instances):
+    deltas: Counter = Counter()
+    for obj in session.new:
+        if isinstance(obj, Comment):
+            deltas[obj.post_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Comment):
+            deltas[obj.post_id] -= 1
+    if any(deltas.values()):
+        apply_comment_deltas(session.connection(), deltas)
+
+
+def reconcile_comment_counts(session: Session) -> int:
+    """Recount comments for every post whose stored count is off; returns how many were fixed."""
+    actual = (
+        select(func.count(Comment.id))
+        .where(Comment.post_id == posts_table.c.id)
+        .scalar_subquery()
+    )
+    result = session.execute(
+        update(posts_table)
+        .where(posts_table.c.comments_count != actual)
+        .values(comments_count=actual, last_modified=posts_table.c.last_modified)
+    )
+    session.commit()
+    return result.rowcount
@@ -1,6 +1,19 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
+
+def to_async_url(url: str) -> str:
+    """A database URL with the async driver (asyncpg / aiosqlite) for async engines."""
+    for sync_prefix, async_prefix in (
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgres://", "postgresql+asyncpg://"),
+        ("sqlite:///", "sqlite+aiosqlite:///"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
 class Settings(BaseSettings):
     PROJECT_NAME: str = "cj36"
     API_V1_STR: str = "/api/v1"
@@ -22,18 +35,100 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str
     EMAILS_FROM_EMAIL: str | None = None
     EMAILS_FROM_NAME: str = "Channel July 36"
+    SMTP_STARTTLS: bool = True
+    SMTP_TIMEOUT: float = 30.0
+    SMTP_IDLE_TIMEOUT: float = 60.0  # seconds before the reused connection is closed
+    # Email outbox (see cj36.core.email)
+    EMAIL_BATCH_SIZE: int = 50
+    EMAIL_POLL_INTERVAL: float = 10.0  # seconds; new mail wakes the sender immediately
+    EMAIL_MAX_ATTEMPTS: int = 8
+    EMAIL_RETRY_BASE: float = 30.0  # seconds, doubled after every failed attempt
+    EMAIL_RETRY_MAX: float = 3600.0
+    # Daily newsletter digest of the previous day's posts (see cj36.core.newsletter)
+    NEWSLETTER_SEND_HOUR: int = 7  # UTC
+    NEWSLETTER_BATCH_SIZE: int = 500  # subscribers per progress checkpoint
+    NEWSLETTER_SMTP_CONNECTIONS: int = 4
+    NEWSLETTER_RATE_PER_SECOND: float = 10.0  # messages per second across all connections
+    # Scheduler leader election (see cj36.core.leader); the lock file is only used without PostgreSQL
+    SCHEDULER_LOCK_PATH: str = "scheduler.lock"
+    SCHEDULER_LEADER_RETRY: float = 10.0  # seconds between followers' attempts to take over
+    # Waking the leader when another worker schedules a post (see cj36.core.publishing)
+    SCHEDULER_WAKEUP_PATH: str = "scheduler.wakeup"  # only used without PostgreSQL
+    SCHEDULER_WAKEUP_INTERVAL: float = 1.0  # seconds; bounds the delay of file wakeups
+    # Safety net for lost wakeups: a post scheduled on another worker is published at most this late
+    SCHEDULER_PUBLISH_POLL: float = 15.0  # seconds
     
     # CORS - Allowed origins for production
     CORS_ORIGINS: str = "http://localhost:5173,http://localhost:3000"
 
     DATABASE_URL: str | None = None
 
+    # Connection pool (per worker process, applied to the sync and async engines)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds; replace connections before server-side idle timeouts
+    DB_POOL_PRE_PING: bool = True
+
+    # Read replicas (comma-separated URLs) for read-only endpoints
+    DATABASE_REPLICA_URLS: str = ""
+    REPLICA_MAX_LAG_SECONDS: float = 5.0  # replicas further behind are skipped
+    REPLICA_CHECK_INTERVAL: float = 5.0  # seconds between replication lag checks
+
+    # In-process cache of anonymous post feed responses
+    RESPONSE_CACHE_SIZE: int = 1024
+    RESPONSE_CACHE_TTL: float = 30.0  # seconds; bounds staleness across workers
+    # Live post changes over Server-Sent Events (see cj36.core.post_stream)
+    STREAM_POLL_INTERVAL: float = 2.0  # seconds; bounds delay of changes committed by other workers
+    STREAM_HEARTBEAT: float = 15.0  # seconds between keep-alive comments on idle connections
+    STREAM_MAX_CLIENTS: int = 10_000  # per worker; more are rejected with 503
+    STREAM_QUEUE_SIZE: int = 256  # pending changes per client before it is told to resync
+    STREAM_BACKFILL_LIMIT: int = 500  # changes replayed on reconnect before falling back to /posts/sync
+    # In-process category tree / topic parent map
+    CATEGORY_CACHE_TTL: float = 300.0  # seconds; bounds staleness across workers
+    # In-process cache of authenticated users (username -> user snapshot)
+    AUTH_CACHE_SIZE: int = 4096
+    AUTH_CACHE_TTL: float = 10.0  # seconds; bounds how long other workers honour a blocked user
+
+    # Password hashing (bcrypt) runs in its own bounded pool
+    BCRYPT_ROUNDS: int = 12  # changing it rehashes passwords on next login
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32  # queued + running; more are rejected with 503
+    PASSWORD_HASH_PROCESSES: bool = True  # False: use threads (bcrypt releases the GIL)
+
+    # Rate limiting per client IP ("count/seconds"); see cj36.core.rate_limit
+    RATE_LIMIT_DEFAULT: str = "100/60"
+    RATE_LIMIT_RULES: str = "POST /api/v1/users/token=10/60,POST /api/v1/users/signup=5/60"
+    RATE_LIMIT_BACKEND: str = "memory"  # "sqlite" shares limits across worker processes
+    RATE_LIMIT_SQLITE_PATH: str = "rate_limit.db"
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+
+    # Cache lifetime of /static files that are not content-addressed (those are immutable)
+    STATIC_MAX_AGE: int = 3600
+    # Largest accepted image upload, in bytes
+    UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024
+    # Resized variants of uploaded images (see cj36.core.images)
+    IMAGE_VARIANT_WIDTHS: str = "320,640,1280"
+    IMAGE_VARIANT_FORMATS: str = "webp,avif"  # formats the installed Pillow cannot write are skipped
+    IMAGE_VARIANT_QUALITY: int = 80
+    IMAGE_WORKERS: int = 2
+    IMAGE_PROCESSES: bool = True  # False: use threads
+
     @property
     def db_url(self) -> str:
         if self.DATABASE_URL:
             return self.DATABASE_URL
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
+    @property
+    def async_db_url(self) -> str:
+        return to_async_url(self.db_url)
+
+    @property
+    def replica_urls(self) -> list[str]:
+        """Parse read replica URLs from comma-separated string"""
+        return [url.strip() for url in self.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+    
     @property
     def emails_from(self) -> str:
         return self.EMAILS_FROM_EMAIL or self.SMTP_USER
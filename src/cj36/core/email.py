@@ -1,35 +1,308 @@
+"""
+Outgoing email.
+
+Request handlers never talk to the mail server: ``enqueue_email`` adds an
+EmailOutbox row to the caller's transaction, so the message is stored if and
+only if the request's changes commit. After the commit the ``outbox_sender``
+thread is woken; it claims due messages in batches of EMAIL_BATCH_SIZE and
+delivers them over one reused, authenticated SMTP connection. Failed messages
+are retried with exponential backoff (EMAIL_RETRY_BASE doubling up to
+EMAIL_RETRY_MAX) until EMAIL_MAX_ATTEMPTS; permanent (5xx) rejections fail
+immediately.
+
+Claiming a batch pushes its ``next_attempt_at`` forward by a lease instead of
+holding a transaction while sending, so several workers can run senders and a
+crashed sender's messages are picked up again once the lease runs out. The
+lease is taken with a conditional UPDATE, so of two senders that read the same
+due rows (SQLite has no row locks) only one claims each message.
+"""
+import datetime
+import logging
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session as SASession
+from sqlmodel import Session, select
 from cj36.core.config import settings
+from cj36.models import EmailOutbox, EmailStatus
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed batch is reserved for the sender that claimed it
+CLAIM_LEASE = datetime.timedelta(minutes=5)
+
+
+def build_message(to_email: str, subject: str, html_content: str) -> MIMEMultipart:
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = f"{settings.EMAILS_FROM_NAME} <{settings.emails_from}>"
+    message["To"] = to_email
+    message.attach(MIMEText(html_content, "html"))
+    return message
+
+
+class SMTPConnection:
+    """
+    One SMTP session, opened (STARTTLS + login) on first use and reused for
+    later messages until it has been idle for ``idle_timeout`` seconds.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = True,
+        timeout: float = 30.0,
+        idle_timeout: float = 60.0,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connects = 0
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "SMTPConnection":
+        return cls(
+            settings.SMTP_HOST,
+            settings.SMTP_PORT,
+            username=settings.SMTP_USER,
+            password=settings.SMTP_PASSWORD,
+            starttls=settings.SMTP_STARTTLS,
+            timeout=settings.SMTP_TIMEOUT,
+            idle_timeout=settings.SMTP_IDLE_TIMEOUT,
+        )
+
+    def _open(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except BaseException:
+            server.close()
+            raise
+        self.connects += 1
+        return server
+
+    def send(self, message: MIMEMultipart) -> None:
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        if self._server is None:
+            self._server = self._open()
+        try:
+            self._server.send_message(message, from_addr=settings.emails_from)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the idle connection; retry once on a fresh one
+            self.close()
+            self._server = self._open()
+            self._server.send_message(message, from_addr=settings.emails_from)
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
 
 def send_email(to_email: str, subject: str, html_content: str):
     """
-    Send an email using SMTP.
+    Send an email immediately, bypassing the outbox (for scripts).
     """
+    connection = SMTPConnection.from_settings()
     try:
-        message = MIMEMultipart("alternative")
-        message["Subject"] = subject
-        message["From"] = f"{settings.EMAILS_FROM_NAME} <{settings.EMAILS_FROM_EMAIL}>"
-        message["To"] = to_email
-
-        part = MIMEText(html_content, "html")
-        message.attach(part)
-
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-            server.starttls()
-            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.sendmail(
-                settings.EMAILS_FROM_EMAIL, to_email, message.as_string()
-            )
+        connection.send(build_message(to_email, subject, html_content))
         return True
     except Exception as e:
-        print(f"Failed to send email: {e}")
+        logger.error(f"Failed to send email: {e}")
         return False
+    finally:
+        connection.close()
+
+
+def enqueue_email(session: Session, to_email: str, subject: str, html_content: str) -> EmailOutbox:
+    """Queue a message; it is sent after ``session`` commits."""
+    email = EmailOutbox(to_email=to_email, subject=subject, html_content=html_content)
+    session.add(email)
+    session.info["email_enqueued"] = True
+    return email
+
+
+class _Claimed(NamedTuple):
+    id: int
+    to_email: str
+    subject: str
+    html_content: str
+    attempts: int
+
+
+def claim_due_emails(session: Session, limit: int) -> List[_Claimed]:
+    """Reserve up to ``limit`` due messages for this sender."""
+    now = datetime.datetime.utcnow()
+    due = (EmailOutbox.status == EmailStatus.PENDING, EmailOutbox.next_attempt_at <= now)
+    rows = session.exec(
+        select(EmailOutbox.id, EmailOutbox.to_email, EmailOutbox.subject, EmailOutbox.html_content, EmailOutbox.attempts)
+        .where(*due)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    claimed = []
+    for row in rows:
+        # Only claim what is still due: without row locks (SQLite) another
+        # sender may have read the same rows and leased them first
+        result = session.exec(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == row.id, *due)
+            .values(attempts=EmailOutbox.attempts + 1, next_attempt_at=now + CLAIM_LEASE)
+        )
+        if result.rowcount == 1:
+            claimed.append(_Claimed(row.id, row.to_email, row.subject, row.html_content, row.attempts + 1))
+    session.commit()
+    return claimed
+
+
+def retry_delay(attempts: int) -> datetime.timedelta:
+    seconds = settings.EMAIL_RETRY_BASE * 2 ** max(attempts - 1, 0)
+    return datetime.timedelta(seconds=min(seconds, settings.EMAIL_RETRY_MAX))
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Rejections of this message (not of the connection) with a 5xx code."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return False
+
+
+def _is_per_message(error: Exception) -> bool:
+    return isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError))
+
+
+def process_outbox(session: Session, connection: SMTPConnection, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Send one batch of due messages; returns counts of what happened."""
+    claimed = claim_due_emails(session, batch_size or settings.EMAIL_BATCH_SIZE)
+    sent: List[int] = []
+    failures: Dict[int, Exception] = {}
+    for index, email in enumerate(claimed):
+        try:
+            connection.send(build_message(email.to_email, email.subject, email.html_content))
+            sent.append(email.id)
+        except Exception as e:
+            failures[email.id] = e
+            if not _is_per_message(e):
+                # The connection itself failed; retry the rest of the batch later
+                connection.close()
+                for remaining in claimed[index + 1:]:
+                    failures[remaining.id] = e
+                break
+
+    now = datetime.datetime.utcnow()
+    if sent:
+        session.exec(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(sent))
+            .values(status=EmailStatus.SENT, sent_at=now, last_error=None)
+        )
+    counts = {"claimed": len(claimed), "sent": len(sent), "retried": 0, "failed": 0}
+    for email in claimed:
+        error = failures.get(email.id)
+        if error is None:
+            continue
+        if _is_permanent(error) or email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            values = {"status": EmailStatus.FAILED}
+            counts["failed"] += 1
+            logger.error(f"Giving up on email #{email.id} to {email.to_email} after {email.attempts} attempt(s): {error}")
+        else:
+            values = {"next_attempt_at": now + retry_delay(email.attempts)}
+            counts["retried"] += 1
+            logger.warning(f"Email #{email.id} to {email.to_email} failed, will retry: {error}")
+        session.exec(update(EmailOutbox).where(EmailOutbox.id == email.id).values(last_error=str(error), **values))
+    session.commit()
+    return counts
+
+
+class OutboxSender:
+    """Background thread draining the outbox; woken by commits that queued mail."""
+
+    def __init__(self, poll_interval: float, batch_size: int):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.connection = SMTPConnection.from_settings()
+        self._engine = None
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def start(self, engine) -> None:
+        if self._thread is not None:
+            return
+        self._engine = engine
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+        self._thread.start()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                with Session(self._engine) as session:
+                    while not self._stopping.is_set():
+                        if process_outbox(session, self.connection, self.batch_size)["claimed"] < self.batch_size:
+                            break
+            except Exception as e:
+                logger.error(f"Error sending queued emails: {e}", exc_info=True)
+            if self._stopping.is_set():
+                break
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+        self.connection.close()
+
+
+outbox_sender = OutboxSender(settings.EMAIL_POLL_INTERVAL, settings.EMAIL_BATCH_SIZE)
+
+
+@event.listens_for(SASession, "after_commit")
+def _wake_outbox_sender(session):
+    if session.info.pop("email_enqueued", False):
+        outbox_sender.wake()
+
+
+@event.listens_for(SASession, "after_soft_rollback")
+def _discard_enqueued(session, previous_transaction):
+    session.info.pop("email_enqueued", None)
+
 
-def send_verification_email(to_email: str, code: str):
+def queue_verification_email(session: Session, to_email: str, code: str) -> EmailOutbox:
     """
-    Send verification code email.
+    Queue the verification code email.
     """
     subject = "Verify your Channel July 36 account"
     html_content = f"""
@@ -50,11 +323,11 @@ def send_verification_email(to_email: str, code: str):
         </body>
     </html>
     """
-    return send_email(to_email, subject, html_content)
+    return enqueue_email(session, to_email, subject, html_content)
 
-def send_password_reset_email(to_email: str, code: str):
+def queue_password_reset_email(session: Session, to_email: str, code: str) -> EmailOutbox:
     """
-    Send password reset OTP email.
+    Queue the password reset OTP email.
     """
     subject = "Reset your Channel July 36 password"
     html_content = f"""
@@ -75,4 +348,4 @@ def send_password_reset_email(to_email: str, code: str):
         </body>
     </html>
     """
-    return send_email(to_email, subject, html_content)
+    return enqueue_email(session, to_email, subject, html_content)
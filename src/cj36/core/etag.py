@@ -0,0 +1,56 @@
+"""
+Strong ETags and conditional requests (If-None-Match on reads, If-Match on writes).
+
+An ETag is a hash of the serialized response body, so it changes whenever
+anything in the representation does, including embedded author and category
+data. Endpoints that cache serialized bodies store the ETag next to them, which
+lets a revalidation hit answer 304 without touching the database or serializing.
+"""
+import hashlib
+from typing import Optional
+from fastapi import HTTPException, Request, Response, status
+
+
+def compute_etag(body: bytes) -> str:
+    """Strong ETag for a response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(header: Optional[str], etag: str, weak: bool) -> bool:
+    """
+    Whether an If-None-Match / If-Match header value matches ``etag``.
+    ``weak`` selects weak comparison (If-None-Match); If-Match compares strongly.
+    """
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if weak and candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def json_response(request: Request, body: bytes, headers: Optional[dict] = None) -> Response:
+    """
+    Serve a serialized JSON body with its ETag, or an empty 304 when the
+    client's If-None-Match already matches it.
+    """
+    headers = dict(headers or {})
+    etag = headers.setdefault("ETag", compute_etag(body))
+    if etag_matches(request.headers.get("if-none-match"), etag, weak=True):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def check_if_match(request: Request, etag: str) -> None:
+    """Raise 412 if the request carries an If-Match header that does not match ``etag``."""
+    header = request.headers.get("if-match")
+    if header is not None and not etag_matches(header, etag, weak=False):
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Resource has been modified",
+        )
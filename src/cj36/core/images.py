@@ -0,0 +1,167 @@
+"""
+Resized image variants for uploaded post images.
+
+After a post with an uploaded image commits, the upload is queued on a
+process pool that writes one file per width in IMAGE_VARIANT_WIDTHS and
+format in IMAGE_VARIANT_FORMATS next to the original (``<name>-<width>w.<fmt>``),
+auto-rotated and without EXIF metadata. The result is stored on
+``Post.image_variants``, which the post API returns so feeds can pick a
+thumbnail instead of the original:
+
+- ``None``: not processed yet (or Pillow is unavailable)
+- ``[]``: the upload could not be decoded as an image
+
+Widths above the original's are skipped; images smaller than every width get
+a single variant at their own size. Pillow is only imported by the workers.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from sqlmodel import Session, select
+from cj36.core.config import settings
+from cj36.models import Post
+
+logger = logging.getLogger(__name__)
+
+# Posts with a locally stored image carry a path under this prefix
+LOCAL_IMAGE_PREFIX = "static/"
+
+
+def variant_path(source: Path, width: int, image_format: str) -> Path:
+    return source.with_name(f"{source.stem}-{width}w.{image_format}")
+
+
+def build_variants(source: str, widths: List[int], formats: List[str], quality: int) -> List[Dict[str, Any]]:
+    """Runs in a pipeline worker; returns ``[{"width", "format", "url"}, ...]``."""
+    from PIL import Image, ImageOps
+
+    Image.init()
+    path = Path(source)
+    variants = []
+    with Image.open(path) as original:
+        icc_profile = original.info.get("icc_profile")
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA", "RGBa") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        targets = sorted({width for width in widths if width < image.width}) or [image.width]
+        for width in targets:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+            for image_format in formats:
+                if image_format.upper() not in Image.SAVE:
+                    continue
+                target = variant_path(path, width, image_format)
+                partial = target.with_name(target.name + ".part")
+                # EXIF and other metadata are dropped by not passing them on;
+                # the colour profile is kept so colours render the same
+                options: Dict[str, Any] = {"quality": quality}
+                if icc_profile:
+                    options["icc_profile"] = icc_profile
+                resized.save(partial, format=image_format.upper(), **options)
+                os.replace(partial, target)
+                variants.append({"width": width, "format": image_format, "url": str(target)})
+    return variants
+
+
+def _parse_list(value: str) -> List[str]:
+    return [item.strip().lower() for item in value.split(",") if item.strip()]
+
+
+def existing_variants(session: Session, image_path: str) -> Optional[List[Dict[str, Any]]]:
+    """Variants already built for ``image_path`` by another post using the same file."""
+    return session.exec(
+        select(Post.image_variants)
+        .where(Post.image == image_path, Post.image_variants.is_not(None))
+        .limit(1)
+    ).first()
+
+
+class ImagePipeline:
+    """Generates image variants off the request path and records them on the post."""
+
+    def __init__(self, workers: int, use_processes: bool = True):
+        self.workers = workers
+        self.use_processes = use_processes
+        self.widths = [int(width) for width in _parse_list(settings.IMAGE_VARIANT_WIDTHS)]
+        self.formats = _parse_list(settings.IMAGE_VARIANT_FORMATS)
+        self.quality = settings.IMAGE_VARIANT_QUALITY
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.use_processes:
+                    # spawn: forking a process that runs threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-variants")
+            return self._executor
+
+    def submit(self, bind, post_id: int, image_path: str) -> Future:
+        """
+        Queue variants for ``image_path``; ``bind`` is the engine to record them
+        with. The returned future resolves once they are stored.
+        """
+        inner = self._get_executor().submit(build_variants, image_path, self.widths, self.formats, self.quality)
+        outer: Future = Future()
+
+        def done(future: Future) -> None:
+            try:
+                self._record(bind, post_id, image_path, future)
+            except BaseException as e:
+                logger.error(f"Could not record image variants for post #{post_id}: {e}", exc_info=True)
+                outer.set_exception(e)
+            else:
+                outer.set_result(None)
+
+        inner.add_done_callback(done)
+        return outer
+
+    def _record(self, bind, post_id: int, image_path: str, future: Future) -> None:
+        try:
+            variants: Optional[List[Dict[str, Any]]] = future.result()
+        except ImportError as e:
+            # Left pending so they are built once Pillow is installed
+            logger.warning(f"Image variants disabled: {e}")
+            return
+        except Exception as e:
+            logger.warning(f"Could not build image variants for post #{post_id} from {image_path}: {e}")
+            variants = []
+        with Session(bind) as session:
+            post = session.get(Post, post_id)
+            # The image may have been replaced while the variants were built
+            if post is None or post.image != image_path:
+                return
+            post.image_variants = variants
+            session.add(post)
+            session.commit()
+
+    def queue_missing(self, session: Session, limit: int = 100) -> int:
+        """Queue local images that have no variants yet (e.g. lost on a restart)."""
+        posts = session.exec(
+            select(Post.id, Post.image)
+            .where(Post.image.startswith(LOCAL_IMAGE_PREFIX), Post.image_variants.is_(None))
+            .order_by(Post.id.desc())
+            .limit(limit)
+        ).all()
+        for post_id, image_path in posts:
+            self.submit(session.get_bind(), post_id, image_path)
+        return len(posts)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+image_pipeline = ImagePipeline(workers=settings.IMAGE_WORKERS, use_processes=settings.IMAGE_PROCESSES)
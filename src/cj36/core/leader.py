@@ -0,0 +1,284 @@
+"""
+Leader election for the background scheduler.
+
+Every worker process runs the application lifespan, but scheduled jobs must
+run in exactly one of them. Workers campaign for a lock and only the holder
+starts the scheduler:
+- PostgreSQL: a session-level ``pg_try_advisory_lock`` held on a dedicated
+  connection; the server releases it when the leader's connection dies
+- otherwise (SQLite): an exclusive ``flock`` on SCHEDULER_LOCK_PATH, released
+  by the kernel when the leader's process exits
+
+Followers retry every SCHEDULER_LEADER_RETRY seconds, so one of them takes
+over shortly after the leader stops. The leader records its identity
+(``host:pid``) with the lock so any worker can report who leads.
+"""
+import logging
+import os
+import socket
+import threading
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.pool import NullPool
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# pg_try_advisory_lock(namespace, key); the namespace spells "cj36"
+LOCK_NAMESPACE = 0x636A3336
+SCHEDULER_LOCK_KEY = 1
+APPLICATION_NAME_PREFIX = "cj36-scheduler "
+
+
+def worker_identity() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class AdvisoryLock:
+    """PostgreSQL advisory lock held by an open connection."""
+
+    backend = "postgres-advisory-lock"
+
+    def __init__(self, url: str, key: int = SCHEDULER_LOCK_KEY):
+        # Outside the application pool: the leader keeps its connection for good
+        self.engine = create_engine(url, poolclass=NullPool)
+        self.key = key
+        self._connection: Optional[Connection] = None
+
+    def try_acquire(self, identity: str) -> bool:
+        connection = self.engine.connect()
+        try:
+            connection.execute(
+                text("SELECT set_config('application_name', :name, false)"),
+                {"name": APPLICATION_NAME_PREFIX + identity},
+            )
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(:namespace, :key)"),
+                {"namespace": LOCK_NAMESPACE, "key": self.key},
+            ).scalar()
+            # The lock is session-level; don't sit idle in a transaction
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def held(self) -> bool:
+        """Whether the lock is still ours, i.e. its connection is alive."""
+        if self._connection is None:
+            return False
+        try:
+            self._connection.execute(text("SELECT 1"))
+            self._connection.commit()
+            return True
+        except Exception as e:
+            logger.warning(f"Lost scheduler lock connection: {e}")
+            self._discard()
+            return False
+
+    def _discard(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def release(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.execute(
+                    text("SELECT pg_advisory_unlock(:namespace, :key)"),
+                    {"namespace": LOCK_NAMESPACE, "key": self.key},
+                )
+                self._connection.commit()
+            except Exception as e:
+                logger.warning(f"Could not release scheduler lock: {e}")
+        self._discard()
+
+    def leader(self) -> Optional[str]:
+        with self.engine.connect() as connection:
+            name = connection.execute(
+                text(
+                    "SELECT a.application_name FROM pg_locks l "
+                    "JOIN pg_stat_activity a ON a.pid = l.pid "
+                    "WHERE l.locktype = 'advisory' AND l.granted "
+                    "AND l.classid = :namespace AND l.objid = :key AND l.objsubid = 2"
+                ),
+                {"namespace": LOCK_NAMESPACE, "key": self.key},
+            ).scalar()
+        if name is None:
+            return None
+        return name[len(APPLICATION_NAME_PREFIX):] if name.startswith(APPLICATION_NAME_PREFIX) else name
+
+    def dispose(self) -> None:
+        self.engine.dispose()
+
+
+class FileLock:
+    """Exclusive flock on a file shared by the workers of one host."""
+
+    backend = "file-lock"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self, identity: str) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, identity.encode(), 0)
+        self._fd = fd
+        return True
+
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.ftruncate(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def leader(self) -> Optional[str]:
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            try:
+                # A shared lock is only granted when nobody leads
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return os.pread(fd, 256, 0).decode() or None
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            return None
+        finally:
+            os.close(fd)
+
+    def dispose(self) -> None:
+        pass
+
+
+class SoleWorker:
+    """No lock available (no PostgreSQL and no flock): assume a single worker."""
+
+    backend = "none"
+
+    def __init__(self):
+        self._identity: Optional[str] = None
+
+    def try_acquire(self, identity: str) -> bool:
+        self._identity = identity
+        return True
+
+    def held(self) -> bool:
+        return self._identity is not None
+
+    def release(self) -> None:
+        self._identity = None
+
+    def leader(self) -> Optional[str]:
+        return self._identity
+
+    def dispose(self) -> None:
+        pass
+
+
+def create_lock(url: str, lock_path: str):
+    if make_url(url).get_backend_name() == "postgresql":
+        return AdvisoryLock(url)
+    if fcntl is not None:
+        return FileLock(lock_path)
+    logger.warning("No scheduler lock available on this platform; run a single worker")
+    return SoleWorker()
+
+
+class LeaderElection:
+    """
+    Campaign thread: acquires the lock when free, calls ``on_elected`` once it
+    holds it and ``on_deposed`` when it loses or gives it up.
+    """
+
+    def __init__(self, lock, on_elected: Callable[[], None], on_deposed: Callable[[], None], retry_interval: float):
+        self.lock = lock
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.retry_interval = retry_interval
+        self.identity = worker_identity()
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="scheduler-election", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                logger.error(f"Scheduler leader election failed: {e}", exc_info=True)
+            self._stop.wait(self.retry_interval)
+
+    def step(self) -> None:
+        """One campaign round: check a held lock or try to take a free one."""
+        with self._lock:
+            if self._stop.is_set():
+                return
+            if self.is_leader:
+                if not self.lock.held():
+                    self.is_leader = False
+                    logger.warning(f"Worker {self.identity} lost scheduler leadership")
+                    self.on_deposed()
+            elif self.lock.try_acquire(self.identity):
+                self.is_leader = True
+                logger.info(f"👑 Worker {self.identity} is the scheduler leader ({self.lock.backend})")
+                self.on_elected()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            if self.is_leader:
+                self.is_leader = False
+                self.on_deposed()
+            self.lock.release()
+        self.lock.dispose()
+
+    def status(self) -> Dict[str, Any]:
+        try:
+            leader = self.identity if self.is_leader else self.lock.leader()
+        except Exception as e:
+            logger.warning(f"Could not look up the scheduler leader: {e}")
+            leader = None
+        return {
+            "worker": self.identity,
+            "is_leader": self.is_leader,
+            "leader": leader,
+            "lock": self.lock.backend,
+        }
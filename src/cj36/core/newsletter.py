@@ -0,0 +1,262 @@
+"""
+Daily newsletter digest.
+
+Once NEWSLETTER_SEND_HOUR (UTC) has passed, the previous day's published posts
+are rendered once, grouped by category, and stored on a NewsletterRun row.
+Subscribers (verified, not blocked, ``newsletter_subscribed``) are then read
+in id order, NEWSLETTER_BATCH_SIZE at a time, each batch in its own short
+transaction. After a batch has been sent the run's ``last_user_id`` is
+committed, so an interrupted run resumes after the last finished batch.
+
+Messages go out over NEWSLETTER_SMTP_CONNECTIONS reused SMTP connections in
+parallel, paced to NEWSLETTER_RATE_PER_SECOND overall. Sends that fail are
+handed to the email outbox, which retries them with backoff.
+"""
+import datetime
+import html
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from cj36.core.config import settings
+from cj36.core.email import SMTPConnection, build_message, enqueue_email
+from cj36.models import Category, NewsletterRun, Post, PostStatus, User
+
+logger = logging.getLogger(__name__)
+
+# A run whose heartbeat is older than this is taken over by another worker
+RUN_LEASE = datetime.timedelta(minutes=10)
+
+
+class Throttle:
+    """Spaces calls to ``wait`` at most ``rate`` per second, across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SMTPPool:
+    """Sends messages in parallel, each thread reusing its own SMTP connection."""
+
+    def __init__(
+        self,
+        size: int,
+        rate: float,
+        connection_factory: Callable[[], SMTPConnection] = SMTPConnection.from_settings,
+    ):
+        self.throttle = Throttle(rate)
+        self.connection_factory = connection_factory
+        self.connections: List[SMTPConnection] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="newsletter-smtp")
+
+    def _connection(self) -> SMTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.connection_factory()
+            self._local.connection = connection
+            with self._lock:
+                self.connections.append(connection)
+        return connection
+
+    def _send(self, message) -> Optional[Exception]:
+        self.throttle.wait()
+        connection = self._connection()
+        try:
+            connection.send(message)
+        except Exception as e:
+            # Start the next message on a fresh connection
+            connection.close()
+            return e
+        return None
+
+    def send_all(self, messages: list) -> List[Optional[Exception]]:
+        """The error of each message, or None where it was sent."""
+        return list(self._executor.map(self._send, messages))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        for connection in self.connections:
+            connection.close()
+
+
+def digest_posts(session: Session, day: datetime.date) -> List[Tuple[str, List[Post]]]:
+    """Posts published on ``day``, grouped by category name."""
+    start = datetime.datetime.combine(day, datetime.time())
+    # Scheduled posts go live at scheduled_at, everything else when created
+    published_at = func.coalesce(Post.scheduled_at, Post.created_at)
+    rows = session.exec(
+        select(Post, Category.name)
+        .outerjoin(Category, Post.category_id == Category.id)
+        .where(
+            Post.status == PostStatus.PUBLISHED,
+            published_at >= start,
+            published_at < start + datetime.timedelta(days=1),
+        )
+        .order_by(published_at.desc(), Post.id.desc())
+    ).all()
+    sections: Dict[str, List[Post]] = {}
+    for post, category_name in rows:
+        sections.setdefault(category_name or "Other", []).append(post)
+    return sorted(sections.items(), key=lambda section: (section[0] == "Other", section[0]))
+
+
+def render_digest(day: datetime.date, sections: List[Tuple[str, List[Post]]]) -> Tuple[str, str]:
+    """Subject and HTML body of the digest."""
+    subject = f"Channel July 36 daily digest: {day:%d %B %Y}"
+    blocks = []
+    for category_name, posts in sections:
+        items = "".join(
+            f"""
+                    <li style="margin-bottom: 12px;">
+                        <strong>{html.escape(post.title)}</strong><br>
+                        <span style="color: #555;">{html.escape(post.description[:200])}</span>
+                    </li>"""
+            for post in posts
+        )
+        blocks.append(
+            f"""
+                <h3 style="color: #C62828; border-bottom: 1px solid #e0e0e0;">{html.escape(category_name)}</h3>
+                <ul style="padding-left: 18px;">{items}
+                </ul>"""
+        )
+    html_content = f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #e0e0e0; border-radius: 5px;">
+                <h2 style="color: #C62828; text-align: center;">Your daily digest</h2>
+                <p>Here is what was published on Channel July 36 on {day:%d %B %Y}.</p>{"".join(blocks)}
+                <br>
+                <p style="font-size: 12px; color: #888; text-align: center;">
+                    You are receiving this because you subscribed to the newsletter.<br>
+                    &copy; 2025 Channel July 36. All rights reserved.
+                </p>
+            </div>
+        </body>
+    </html>
+    """
+    return subject, html_content
+
+
+def start_run(session: Session, day: datetime.date) -> Optional[NewsletterRun]:
+    """
+    The run for ``day`` if this worker should send it: a new run, or an
+    unfinished one whose previous sender stopped heart-beating. None when there
+    is nothing to send or another worker is sending.
+    """
+    now = datetime.datetime.utcnow()
+    run = session.exec(select(NewsletterRun).where(NewsletterRun.digest_date == day)).first()
+    if run is None:
+        sections = digest_posts(session, day)
+        if not sections:
+            return None
+        subject, html_content = render_digest(day, sections)
+        run = NewsletterRun(digest_date=day, subject=subject, html_content=html_content)
+        session.add(run)
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return None
+        session.refresh(run)
+        return run
+
+    if run.completed or run.updated_at > now - RUN_LEASE:
+        return None
+    claimed = session.exec(
+        update(NewsletterRun)
+        .where(NewsletterRun.id == run.id, NewsletterRun.updated_at == run.updated_at)
+        .values(updated_at=now)
+    )
+    session.commit()
+    if claimed.rowcount != 1:
+        return None
+    session.refresh(run)
+    logger.info(f"Resuming newsletter digest for {day} after subscriber #{run.last_user_id}")
+    return run
+
+
+def send_digest(
+    engine,
+    day: datetime.date,
+    pool: Optional[SMTPPool] = None,
+    batch_size: Optional[int] = None,
+) -> Optional[NewsletterRun]:
+    """Send (or resume) the digest for ``day``; returns the finished run."""
+    batch_size = batch_size or settings.NEWSLETTER_BATCH_SIZE
+    with Session(engine) as session:
+        run = start_run(session, day)
+        if run is None:
+            return None
+        run_id, last_user_id = run.id, run.last_user_id
+        subject, html_content = run.subject, run.html_content
+
+    own_pool = pool is None
+    if own_pool:
+        pool = SMTPPool(settings.NEWSLETTER_SMTP_CONNECTIONS, settings.NEWSLETTER_RATE_PER_SECOND)
+    try:
+        while True:
+            with Session(engine) as session:
+                subscribers = session.exec(
+                    select(User.id, User.email)
+                    .where(
+                        User.newsletter_subscribed == True,  # noqa: E712
+                        User.is_verified == True,  # noqa: E712
+                        User.is_blocked == False,  # noqa: E712
+                        User.email.is_not(None),
+                        User.id > last_user_id,
+                    )
+                    .order_by(User.id)
+                    .limit(batch_size)
+                ).all()
+            if not subscribers:
+                break
+
+            errors = pool.send_all([build_message(email, subject, html_content) for _, email in subscribers])
+            last_user_id = subscribers[-1][0]
+            deferred = 0
+            with Session(engine) as session:
+                for (_, email), error in zip(subscribers, errors):
+                    if error is not None:
+                        deferred += 1
+                        enqueue_email(session, email, subject, html_content)
+                session.exec(
+                    update(NewsletterRun)
+                    .where(NewsletterRun.id == run_id)
+                    .values(
+                        last_user_id=last_user_id,
+                        sent_count=NewsletterRun.sent_count + len(subscribers) - deferred,
+                        deferred_count=NewsletterRun.deferred_count + deferred,
+                        updated_at=datetime.datetime.utcnow(),
+                    )
+                )
+                session.commit()
+
+        with Session(engine) as session:
+            run = session.get(NewsletterRun, run_id)
+            run.completed = True
+            run.finished_at = datetime.datetime.utcnow()
+            session.add(run)
+            session.commit()
+            session.refresh(run)
+            return run
+    finally:
+        if own_pool:
+            pool.close()
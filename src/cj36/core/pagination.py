@@ -0,0 +1,30 @@
+"""
+Opaque keyset cursors for paginated endpoints.
+
+A cursor encodes the sort key ``(timestamp, id)`` of the last row of a page,
+so the next page can be fetched with an index range scan instead of OFFSET.
+"""
+import base64
+import binascii
+import datetime
+from typing import Tuple
+
+
+def encode_cursor(timestamp: datetime.datetime, row_id: int) -> str:
+    """Encode a ``(timestamp, id)`` sort key as a URL-safe opaque string."""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """
+    Decode a cursor produced by ``encode_cursor``.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        timestamp, row_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
@@ -0,0 +1,151 @@
+"""
+Password hashing off the request threadpool.
+
+bcrypt is deliberately slow, so hashing and verification run in a dedicated
+pool of PASSWORD_HASH_WORKERS processes instead of the threadpool that serves
+reads. At most PASSWORD_HASH_MAX_PENDING operations may be queued or running
+at once; beyond that callers are rejected immediately with 503 rather than
+queueing behind a login storm.
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException, status
+from cj36.core.config import settings
+from cj36.core.security import get_password_hash, pwd_context
+
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    ``(valid, new_hash)``; ``new_hash`` is set when the stored hash uses
+    outdated parameters (e.g. a lower BCRYPT_ROUNDS) and should be replaced.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _timed_call(fn: Callable, *args) -> Tuple[Any, float]:
+    # Runs in the worker; reports execution time so queue wait can be derived
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class HashingPool:
+    """Bounded executor for password hashing with rejection and metrics."""
+
+    def __init__(self, workers: int, max_pending: int, use_processes: bool = True):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_wait = 0.0
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.use_processes:
+                    # spawn: forking a process that runs threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"},
+            )
+        with self._lock:
+            self.pending += 1
+        submitted_at = time.perf_counter()
+        try:
+            inner = self._get_executor().submit(_timed_call, fn, *args)
+        except Exception:
+            self._finish(None, submitted_at)
+            raise
+        outer: Future = Future()
+
+        def done(future: Future) -> None:
+            try:
+                result, run_time = future.result()
+            except BaseException as e:
+                self._finish(None, submitted_at)
+                outer.set_exception(e)
+            else:
+                self._finish(run_time, submitted_at)
+                outer.set_result(result)
+
+        inner.add_done_callback(done)
+        return outer
+
+    def _finish(self, run_time: Optional[float], submitted_at: float) -> None:
+        elapsed = time.perf_counter() - submitted_at
+        with self._lock:
+            self.pending -= 1
+            if run_time is None:
+                self.failed += 1
+            else:
+                wait = max(elapsed - run_time, 0.0)
+                self.completed += 1
+                self.total_run += run_time
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+        self._slots.release()
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run ``fn(*args)`` in the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self._submit(fn, *args))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "executor": "process" if self.use_processes else "thread",
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "avg_run_ms": round(self.total_run / self.completed * 1000, 3) if self.completed else 0.0,
+                "avg_wait_ms": round(self.total_wait / self.completed * 1000, 3) if self.completed else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+hashing_pool = HashingPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    use_processes=settings.PASSWORD_HASH_PROCESSES,
+)
+
+
+async def hash_password(password: str) -> str:
+    return await hashing_pool.run(get_password_hash, password)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update in the hashing pool."""
+    return await hashing_pool.run(verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,361 @@
+"""
+Live post changes for /posts/stream (Server-Sent Events).
+
+One poller per worker process reads the posts changed since its watermark,
+with the same ``(last_modified, id)`` keyset as /posts/sync, and fans each
+change out to every connected client. An idle connection costs a queue and a
+heartbeat timer, never a query. A commit in this process that touches the
+feed (API writes, scheduler publishes) wakes the poller at once; changes
+committed by other workers are picked up within STREAM_POLL_INTERVAL seconds.
+
+Event ids are /posts/sync tokens. A client reconnecting with Last-Event-ID is
+replayed what it missed, or sent a ``reset`` event to catch up through
+/posts/sync when that is more than STREAM_BACKFILL_LIMIT changes. Like the
+sync, the SYNC_OVERLAP window before a watermark is re-read so transactions
+that commit out of timestamp order are never skipped; events may therefore
+repeat and clients must apply them idempotently. Like the sync, a client is
+only told about deletions of posts it could have seen: tombstones of public
+posts (or of drafts it may view) and posts leaving PUBLISHED.
+"""
+import asyncio
+import datetime
+import json
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import event, tuple_
+from sqlalchemy.orm import Session as SASession
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cj36.core.config import settings
+from cj36.core.pagination import encode_cursor
+from cj36.models import Post, PostRead, PostStatus, PostTombstone
+
+logger = logging.getLogger(__name__)
+
+# Rows changed within this window before a watermark are read again, so
+# transactions that commit out of timestamp order are never skipped.
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+ChangeKey = Tuple[datetime.datetime, int]
+
+
+class PostChange:
+    """A changed post, or a deleted one (``post`` is None), keyed like /posts/sync."""
+
+    __slots__ = ("key", "post_id", "post", "was_published", "author_id", "_payloads")
+
+    def __init__(
+        self,
+        key: ChangeKey,
+        post_id: int,
+        post: Optional[Post] = None,
+        was_published: bool = True,
+        author_id: Optional[int] = None,
+    ):
+        self.key = key
+        self.post_id = post_id
+        self.post = post
+        # For deletions: who may learn about them (see PostTombstone)
+        self.was_published = was_published
+        self.author_id = author_id
+        self._payloads: Dict[bool, str] = {}
+
+    @property
+    def unpublished(self) -> bool:
+        """Whether this change is the post leaving PUBLISHED."""
+        return (
+            self.post is not None
+            and self.post.status != PostStatus.PUBLISHED
+            and self.post.unpublished_at is not None
+            and self.post.unpublished_at == self.post.last_modified
+        )
+
+    @property
+    def event_id(self) -> str:
+        return encode_cursor(*self.key)
+
+    @property
+    def category_ids(self) -> Set[int]:
+        if self.post is None:
+            return set()
+        ids = {topic.id for topic in self.post.topics}
+        if self.post.category_id is not None:
+            ids.add(self.post.category_id)
+        return ids
+
+    def payload(self, full: bool) -> str:
+        """Event data, serialized once and shared by every subscriber."""
+        if full not in self._payloads:
+            if full:
+                data = PostRead.model_validate(self.post).model_dump_json()
+            else:
+                data = json.dumps({
+                    "id": self.post_id,
+                    "category_id": self.post.category_id,
+                    "topic_ids": sorted(topic.id for topic in self.post.topics),
+                    "last_modified": self.post.last_modified.isoformat(),
+                })
+            self._payloads[full] = data
+        return self._payloads[full]
+
+
+def format_event(event_type: str, data: str, event_id: Optional[str] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event_type}", f"data: {data}"]
+    return "\n".join(lines) + "\n\n"
+
+
+async def fetch_changes(
+    session: AsyncSession, since: ChangeKey, limit: int, load_options: Sequence = ()
+) -> Tuple[List[PostChange], bool]:
+    """Up to ``limit`` posts changed after ``since`` plus the deletions among them, in key order."""
+    posts = (await session.exec(
+        select(Post)
+        .where(tuple_(Post.last_modified, Post.id) > since)
+        .order_by(Post.last_modified, Post.id)
+        .limit(limit + 1)
+        .options(*load_options)
+    )).all()
+    has_more = len(posts) > limit
+    posts = posts[:limit]
+
+    tombstone_query = select(
+        PostTombstone.post_id, PostTombstone.deleted_at, PostTombstone.was_published, PostTombstone.author_id
+    ).where(PostTombstone.deleted_at > since[0])
+    if has_more:
+        tombstone_query = tombstone_query.where(PostTombstone.deleted_at <= posts[-1].last_modified)
+    tombstones = (await session.exec(tombstone_query)).all()
+
+    changes = [PostChange((post.last_modified, post.id), post.id, post) for post in posts]
+    changes.extend(
+        PostChange((row.deleted_at, row.post_id), row.post_id, was_published=row.was_published, author_id=row.author_id)
+        for row in tombstones
+    )
+    changes.sort(key=lambda change: change.key)
+    return changes, has_more
+
+
+class Subscriber:
+    """One connected client: its filter, visibility and pending changes."""
+
+    def __init__(
+        self,
+        categories: Sequence[int],
+        can_view: Callable[[Post], bool],
+        can_view_unpublished: Callable[[Optional[int]], bool],
+        full: bool,
+        max_pending: int,
+    ):
+        self.categories = set(categories)
+        self.can_view = can_view
+        # Called with an author id: may this client see that author's unpublished posts?
+        self.can_view_unpublished = can_view_unpublished
+        self.full = full
+        self.queue: "asyncio.Queue[PostChange]" = asyncio.Queue(max_pending)
+        # Set when the client fell too far behind; it is sent a reset and disconnected
+        self.overflowed = False
+        self.last_key: Optional[ChangeKey] = None
+
+    def offer(self, change: PostChange) -> bool:
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return False
+        return True
+
+    def render(self, change: PostChange) -> Optional[str]:
+        """The SSE frame for ``change``, or None when the client could not see it."""
+        if change.post is None:
+            if not (change.was_published or self.can_view_unpublished(change.author_id)):
+                return None
+            event_type = "delete"
+        elif self.categories and not self.categories & change.category_ids:
+            return None
+        elif self.can_view(change.post):
+            event_type = "post"
+        elif change.unpublished:
+            event_type = "delete"
+        else:
+            # An invisible post that was not public before this change either
+            return None
+        self.last_key = change.key
+        if event_type == "post":
+            return format_event("post", change.payload(self.full), change.event_id)
+        return format_event("delete", json.dumps({"id": change.post_id}), change.event_id)
+
+    def reset_event(self, since: Optional[ChangeKey]) -> str:
+        """Tell the client to catch up through /posts/sync from ``since``."""
+        token = encode_cursor(since[0] - SYNC_OVERLAP, 0) if since is not None else ""
+        return format_event("reset", json.dumps({"since": token}))
+
+
+class PostChangeFeed:
+    """Polls post changes for this worker and fans them out to subscribers."""
+
+    def __init__(self, poll_interval: float, heartbeat: float, max_clients: int, max_pending: int, backfill_limit: int):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.max_pending = max_pending
+        self.backfill_limit = backfill_limit
+        self.engine = None
+        self.load_options: Sequence = ()
+        self.subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watermark: Optional[datetime.datetime] = None
+        # Changes inside the overlap window that were already delivered
+        self._seen: Dict[Tuple[bool, int], datetime.datetime] = {}
+        self.polls = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(
+        self,
+        engine,
+        categories: Sequence[int] = (),
+        can_view: Callable[[Post], bool] = lambda post: True,
+        can_view_unpublished: Callable[[Optional[int]], bool] = lambda author_id: True,
+        full: bool = False,
+        load_options: Sequence = (),
+    ) -> Subscriber:
+        """Register a client and make sure this worker's poller runs; 503 when full."""
+        if len(self.subscribers) >= self.max_clients:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many live connections, please poll /posts/sync",
+                headers={"Retry-After": "30"},
+            )
+        self.engine = engine
+        self.load_options = load_options
+        subscriber = Subscriber(categories, can_view, can_view_unpublished, full, self.max_pending)
+        self.subscribers.add(subscriber)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        # The poller stops by itself once nobody listens
+        self.subscribers.discard(subscriber)
+
+    def notify(self) -> None:
+        """Wake the poller; safe to call from any thread."""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # the loop closed meanwhile
+
+    async def _run(self) -> None:
+        wake = self._wake
+        self._watermark = datetime.datetime.utcnow()
+        self._seen.clear()
+        while self.subscribers and wake is self._wake:
+            wake.clear()
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.warning(f"Post stream poll failed: {e}")
+            try:
+                await asyncio.wait_for(wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self) -> int:
+        """Deliver the changes committed since the last poll; returns how many."""
+        self.polls += 1
+        since: ChangeKey = (self._watermark - SYNC_OVERLAP, 0)
+        delivered = 0
+        async with AsyncSession(self.engine, expire_on_commit=False) as session:
+            while True:
+                changes, has_more = await fetch_changes(session, since, self.max_pending, self.load_options)
+                for change in changes:
+                    seen_key = (change.post is None, change.post_id)
+                    if self._seen.get(seen_key) == change.key[0]:
+                        continue
+                    self._seen[seen_key] = change.key[0]
+                    self._watermark = max(self._watermark, change.key[0])
+                    self._publish(change)
+                    delivered += 1
+                if not has_more:
+                    break
+                since = max(change.key for change in changes if change.post is not None)
+        horizon = self._watermark - SYNC_OVERLAP
+        self._seen = {key: at for key, at in self._seen.items() if at >= horizon}
+        return delivered
+
+    def _publish(self, change: PostChange) -> None:
+        for subscriber in list(self.subscribers):
+            was_overflowed = subscriber.overflowed
+            if subscriber.offer(change):
+                self.delivered += 1
+            elif not was_overflowed:
+                self.overflows += 1
+
+    async def stream(self, subscriber: Subscriber, since: Optional[ChangeKey] = None) -> AsyncIterator[str]:
+        """SSE frames for ``subscriber``: the replay after ``since``, then live changes and heartbeats."""
+        try:
+            yield f"retry: {int(self.poll_interval * 1000)}\n\n"
+            if since is not None:
+                async with AsyncSession(self.engine, expire_on_commit=False) as session:
+                    changes, has_more = await fetch_changes(
+                        session, (since[0] - SYNC_OVERLAP, 0), self.backfill_limit, self.load_options
+                    )
+                if has_more:
+                    yield subscriber.reset_event(since)
+                    return
+                for change in changes:
+                    frame = subscriber.render(change)
+                    if frame is not None:
+                        yield frame
+            while True:
+                if subscriber.overflowed:
+                    yield subscriber.reset_event(subscriber.last_key or since)
+                    return
+                try:
+                    change = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing the idle connection
+                    yield ": ping\n\n"
+                    continue
+                frame = subscriber.render(change)
+                if frame is not None:
+                    yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "subscribers": len(self.subscribers),
+            "max_clients": self.max_clients,
+            "polling": self._task is not None and not self._task.done(),
+            "polls": self.polls,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+
+post_change_feed = PostChangeFeed(
+    poll_interval=settings.STREAM_POLL_INTERVAL,
+    heartbeat=settings.STREAM_HEARTBEAT,
+    max_clients=settings.STREAM_MAX_CLIENTS,
+    max_pending=settings.STREAM_QUEUE_SIZE,
+    backfill_limit=settings.STREAM_BACKFILL_LIMIT,
+)
+
+
+# Inserted first so it sees the flag before cj36.core.cache consumes it
+@event.listens_for(SASession, "after_commit", insert=True)
+def _wake_post_stream(session):
+    if session.info.get("feed_changed"):
+        post_change_feed.notify()
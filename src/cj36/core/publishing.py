@@ -0,0 +1,258 @@
+"""
+Exact-time publishing of scheduled posts.
+
+``publish_due_posts`` publishes every due SCHEDULED post with a single
+``UPDATE ... RETURNING`` (served by the (status, scheduled_at) index) instead
+of loading and flipping ORM objects one by one. A bulk UPDATE bypasses the
+flush listeners, so it adjusts the category counts itself and flags the feed
+cache and category tree for invalidation on commit.
+
+``publish_timer`` keeps one APScheduler date job armed for the earliest
+``scheduled_at``: the publish job re-arms it for the next due post after each
+run, and ``create_post`` / ``update_post`` re-arm it when they schedule a post
+earlier than the armed time, so embargoed stories go live on the second.
+
+Only the scheduler leader (see cj36.core.leader) has a timer. Other workers
+wake it through ``publish_wakeup`` after committing a schedule, and the
+leader re-arms from the database:
+- PostgreSQL: ``NOTIFY`` on PUBLISH_CHANNEL, which the leader ``LISTEN``s on
+- otherwise (SQLite): touching SCHEDULER_WAKEUP_PATH, whose modification
+  time the leader checks every SCHEDULER_WAKEUP_INTERVAL seconds
+A lost wakeup is caught by the SCHEDULER_PUBLISH_POLL interval job.
+
+Posts taken out of publication get ``unpublished_at`` stamped with the same
+instant as ``last_modified``, so delta feeds can tell readers to drop them
+without announcing drafts that were never public.
+"""
+import datetime
+import logging
+import os
+import select as select_module
+import threading
+from collections import Counter
+from typing import Callable, List, Optional
+from apscheduler.triggers.date import DateTrigger
+from sqlalchemy import create_engine, event, func, inspect, text, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session as SASession
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, select
+from cj36.core.category_counts import apply_count_deltas, previous_state
+from cj36.core.config import settings
+from cj36.models import Post, PostStatus
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_CHANNEL = "cj36_publish"
+
+
+def publish_due_posts(session: Session, now: Optional[datetime.datetime] = None) -> List[int]:
+    """Publish every scheduled post due at ``now``; returns their ids."""
+    now = now or datetime.datetime.utcnow()
+    due = (Post.status == PostStatus.SCHEDULED, Post.scheduled_at <= now)
+    values = {"status": PostStatus.PUBLISHED, "last_modified": now}
+    if session.get_bind().dialect.update_returning:
+        rows = session.exec(
+            update(Post).where(*due).values(**values).returning(Post.id, Post.category_id)
+        ).all()
+    else:
+        # Databases without UPDATE ... RETURNING (SQLite < 3.35)
+        rows = session.exec(select(Post.id, Post.category_id).where(*due).with_for_update()).all()
+        if rows:
+            session.exec(update(Post).where(Post.id.in_([row[0] for row in rows])).values(**values))
+
+    if rows:
+        apply_count_deltas(
+            session.connection(), Counter(category_id for _, category_id in rows if category_id is not None)
+        )
+        session.info["feed_changed"] = True
+        session.info["category_counts_changed"] = True
+    session.commit()
+    return [post_id for post_id, _ in rows]
+
+
+def next_due_at(session: Session) -> Optional[datetime.datetime]:
+    """``scheduled_at`` of the next post waiting to be published."""
+    return session.exec(
+        select(func.min(Post.scheduled_at)).where(Post.status == PostStatus.SCHEDULED)
+    ).first()
+
+
+def _as_utc(moment: datetime.datetime) -> datetime.datetime:
+    # scheduled_at is stored as naive UTC
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.astimezone(datetime.timezone.utc)
+
+
+class PublishTimer:
+    """A one-shot scheduler job armed for the earliest due ``scheduled_at``."""
+
+    JOB_ID = "publish_scheduled_posts_at"
+
+    def __init__(self):
+        self.scheduler = None
+        self._job: Optional[Callable[[], None]] = None
+        self._lock = threading.Lock()
+
+    def attach(self, scheduler, job: Callable[[], None]) -> None:
+        self.scheduler = scheduler
+        self._job = job
+
+    def armed_for(self) -> Optional[datetime.datetime]:
+        job = self.scheduler.get_job(self.JOB_ID) if self.scheduler is not None else None
+        return job.next_run_time if job is not None else None
+
+    def arm(self, due_at: Optional[datetime.datetime]) -> bool:
+        """Make sure the publish job runs no later than ``due_at``; False when this worker has no timer."""
+        if self.scheduler is None or not self.scheduler.running:
+            return False
+        if due_at is None:
+            return True
+        # Overdue posts are published right away rather than skipped as misfired
+        run_at = max(_as_utc(due_at), datetime.datetime.now(datetime.timezone.utc))
+        with self._lock:
+            armed = self.armed_for()
+            if armed is not None and armed <= run_at:
+                return True
+            self.scheduler.add_job(
+                func=self._job,
+                trigger=DateTrigger(run_date=run_at),
+                id=self.JOB_ID,
+                name='Publish scheduled posts on time',
+                replace_existing=True,
+                misfire_grace_time=None,
+            )
+        return True
+
+
+publish_timer = PublishTimer()
+
+
+class PublishWakeup:
+    """
+    Cross-worker wakeup of the scheduler leader: ``signal`` from any worker,
+    ``start`` a listener thread in the leader calling ``on_wake`` for each one.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def signal(self) -> None:
+        raise NotImplementedError
+
+    def _listen(self, on_wake: Callable[[], None]) -> None:
+        raise NotImplementedError
+
+    def start(self, on_wake: Callable[[], None]) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(on_wake,), name="publish-wakeup", daemon=True)
+        self._thread.start()
+
+    def _run(self, on_wake: Callable[[], None]) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen(on_wake)
+            except Exception as e:
+                logger.warning(f"Publish wakeup listener failed, retrying: {e}")
+                self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+
+class NotifyWakeup(PublishWakeup):
+    """PostgreSQL NOTIFY / LISTEN on PUBLISH_CHANNEL."""
+
+    def __init__(self, url: str, interval: float):
+        super().__init__(interval)
+        # Outside the application pool: the listener keeps its connection
+        self.engine = create_engine(url, poolclass=NullPool)
+
+    def signal(self) -> None:
+        with self.engine.connect() as connection:
+            connection.execute(text(f"NOTIFY {PUBLISH_CHANNEL}"))
+            connection.commit()
+
+    def _listen(self, on_wake: Callable[[], None]) -> None:
+        connection = self.engine.raw_connection()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            dbapi_connection.cursor().execute(f"LISTEN {PUBLISH_CHANNEL}")
+            # Schedules committed before LISTEN took effect
+            on_wake()
+            while not self._stop.is_set():
+                if select_module.select([dbapi_connection], [], [], self.interval)[0]:
+                    dbapi_connection.poll()
+                    if dbapi_connection.notifies:
+                        dbapi_connection.notifies.clear()
+                        on_wake()
+        finally:
+            connection.close()
+
+
+class FileWakeup(PublishWakeup):
+    """A file shared by the workers of one host; touching it wakes the leader."""
+
+    def __init__(self, path: str, interval: float):
+        super().__init__(interval)
+        self.path = path
+
+    def signal(self) -> None:
+        with open(self.path, "a"):
+            pass
+        os.utime(self.path)
+
+    def _modified(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _listen(self, on_wake: Callable[[], None]) -> None:
+        seen = self._modified()
+        while not self._stop.wait(self.interval):
+            modified = self._modified()
+            if modified != seen:
+                seen = modified
+                on_wake()
+
+
+def create_wakeup(url: str, path: str, interval: float) -> PublishWakeup:
+    if make_url(url).get_backend_name() == "postgresql":
+        return NotifyWakeup(url, interval)
+    return FileWakeup(path, interval)
+
+
+publish_wakeup = create_wakeup(settings.db_url, settings.SCHEDULER_WAKEUP_PATH, settings.SCHEDULER_WAKEUP_INTERVAL)
+
+
+def schedule_publishing(due_at: Optional[datetime.datetime]) -> None:
+    """After committing a schedule: arm the timer here if this worker leads, else wake the leader."""
+    if publish_timer.arm(due_at):
+        return
+    try:
+        publish_wakeup.signal()
+    except Exception as e:
+        logger.warning(f"Could not wake the scheduler leader, post waits for the next poll: {e}")
+
+
+@event.listens_for(SASession, "before_flush")
+def _record_unpublishing(session, flush_context, instances):
+    for obj in session.dirty:
+        if not isinstance(obj, Post) or obj in session.deleted:
+            continue
+        if not inspect(obj).attrs.status.history.added:
+            continue
+        was, _ = previous_state(session, obj)
+        if was == PostStatus.PUBLISHED and PostStatus(obj.status) != PostStatus.PUBLISHED:
+            # The same instant marks this change as the transition out of PUBLISHED
+            obj.unpublished_at = obj.last_modified = datetime.datetime.utcnow()
@@ -0,0 +1,231 @@
+"""
+Per-client, per-route rate limiting.
+
+Each (rule, client IP) pair gets a sliding window counter: the request count
+of the current fixed window plus the previous window's count weighted by how
+much of it still overlaps the sliding window. That is three integers per key
+and O(1) work per request.
+
+Counters live in a pluggable backend:
+- ``memory``: an in-process LRU bounded to RATE_LIMIT_MAX_KEYS keys
+- ``sqlite``: a shared SQLite file (RATE_LIMIT_SQLITE_PATH), so limits hold
+  across all worker processes on the host; its blocking I/O runs in the
+  threadpool, off the event loop
+
+Rules are "[METHOD ]path-prefix=count/seconds", comma-separated in
+RATE_LIMIT_RULES; the longest matching prefix wins, RATE_LIMIT_DEFAULT
+applies otherwise.
+"""
+import logging
+import math
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from cj36.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit(NamedTuple):
+    name: str
+    method: Optional[str]
+    path_prefix: str
+    limit: int
+    window: float
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int
+
+
+# (window index, previous window count, current window count)
+WindowState = Tuple[int, int, int]
+
+
+def slide(state: Optional[WindowState], limit: int, window: float, now: float) -> Tuple[Decision, WindowState]:
+    """Apply one request to a counter; returns the decision and the state to store."""
+    index = int(now // window)
+    previous, current = 0, 0
+    if state is not None:
+        if state[0] == index:
+            previous, current = state[1], state[2]
+        elif state[0] == index - 1:
+            previous = state[2]
+    elapsed = (now % window) / window
+    estimate = previous * (1 - elapsed) + current
+
+    if estimate + 1 > limit:
+        if current + 1 > limit or previous == 0:
+            wait = window - now % window
+        else:
+            # When the previous window's weight has decayed enough to fit one more
+            wait = ((1 - (limit - current - 1) / previous) - elapsed) * window
+        return Decision(False, limit, 0, max(1, math.ceil(wait))), (index, previous, current)
+
+    remaining = max(0, math.floor(limit - estimate - 1))
+    return Decision(True, limit, remaining, 0), (index, previous, current + 1)
+
+
+class MemoryBackend:
+    """Counters in this process, least recently used keys evicted first."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._states: "OrderedDict[str, WindowState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: float, now: float) -> Decision:
+        with self._lock:
+            decision, state = slide(self._states.get(key), limit, window, now)
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+            return decision
+
+    def reset(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+
+class SQLiteBackend:
+    """
+    Counters in a SQLite file shared by every worker on the host. Rows idle for
+    two windows are pruned and the table is capped at ``max_keys`` rows. If the
+    file is busy beyond a few milliseconds the request is let through rather
+    than holding a threadpool thread.
+    """
+
+    PRUNE_EVERY = 1000
+    # File I/O: RateLimiter.check runs hit() in the threadpool
+    blocking = True
+
+    def __init__(self, path: str, max_keys: int, busy_timeout: float = 0.05):
+        self.path = path
+        self.max_keys = max_keys
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._hits = 0
+        # hit() runs on several threadpool threads at once
+        self._hits_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit ("
+                "key TEXT PRIMARY KEY, window INTEGER NOT NULL, previous INTEGER NOT NULL, "
+                "current INTEGER NOT NULL, touched REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_touched ON rate_limit (touched)")
+            self._local.connection = connection
+        return connection
+
+    def hit(self, key: str, limit: int, window: float, now: float) -> Decision:
+        connection = self._connection()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT window, previous, current FROM rate_limit WHERE key = ?", (key,)
+            ).fetchone()
+            decision, state = slide(row, limit, window, now)
+            connection.execute(
+                "INSERT INTO rate_limit (key, window, previous, current, touched) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET window = excluded.window, previous = excluded.previous, "
+                "current = excluded.current, touched = excluded.touched",
+                (key, *state, now),
+            )
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            logger.warning(f"Rate limit store unavailable, allowing request: {e}")
+            return Decision(True, limit, limit, 0)
+
+        with self._hits_lock:
+            self._hits += 1
+            prune = self._hits % self.PRUNE_EVERY == 0
+        if prune:
+            self._prune(connection, now - 2 * window)
+        return decision
+
+    def _prune(self, connection: sqlite3.Connection, idle_before: float) -> None:
+        try:
+            connection.execute("DELETE FROM rate_limit WHERE touched < ?", (idle_before,))
+            connection.execute(
+                "DELETE FROM rate_limit WHERE key IN ("
+                "SELECT key FROM rate_limit ORDER BY touched DESC LIMIT -1 OFFSET ?)",
+                (self.max_keys,),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not prune rate limit store: {e}")
+
+    def reset(self) -> None:
+        self._connection().execute("DELETE FROM rate_limit")
+
+
+def parse_limit(value: str) -> Tuple[int, float]:
+    """'100/60' -> (100 requests, 60 seconds)."""
+    count, seconds = value.split("/")
+    return int(count), float(seconds)
+
+
+def parse_rules(value: str) -> List[RateLimit]:
+    rules = []
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        target, limit = entry.rsplit("=", 1)
+        parts = target.split()
+        method, path_prefix = (parts[0].upper(), parts[1]) if len(parts) == 2 else (None, parts[0])
+        rules.append(RateLimit(target.strip(), method, path_prefix, *parse_limit(limit.strip())))
+    # Most specific first
+    return sorted(rules, key=lambda rule: (len(rule.path_prefix), rule.method is not None), reverse=True)
+
+
+class RateLimiter:
+    def __init__(self, backend, default: RateLimit, rules: List[RateLimit]):
+        self.backend = backend
+        self.default = default
+        self.rules = rules
+
+    def rule_for(self, method: str, path: str) -> RateLimit:
+        for rule in self.rules:
+            if path.startswith(rule.path_prefix) and rule.method in (None, method):
+                return rule
+        return self.default
+
+    def hit(self, method: str, path: str, client: str, now: float) -> Decision:
+        rule = self.rule_for(method, path)
+        return self.backend.hit(f"{rule.name}|{client}", rule.limit, rule.window, now)
+
+    async def check(self, method: str, path: str, client: str, now: float) -> Decision:
+        """``hit`` for async callers: blocking backends run in the threadpool."""
+        if getattr(self.backend, "blocking", False):
+            return await run_in_threadpool(self.hit, method, path, client, now)
+        return self.hit(method, path, client, now)
+
+    def reset(self) -> None:
+        self.backend.reset()
+
+
+def create_rate_limiter() -> RateLimiter:
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        backend = SQLiteBackend(settings.RATE_LIMIT_SQLITE_PATH, settings.RATE_LIMIT_MAX_KEYS)
+    elif settings.RATE_LIMIT_BACKEND == "memory":
+        backend = MemoryBackend(settings.RATE_LIMIT_MAX_KEYS)
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {settings.RATE_LIMIT_BACKEND}")
+    default = RateLimit("default", None, "/", *parse_limit(settings.RATE_LIMIT_DEFAULT))
+    return RateLimiter(backend, default, parse_rules(settings.RATE_LIMIT_RULES))
+
+
+rate_limiter = create_rate_limiter()
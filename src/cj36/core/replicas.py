@@ -0,0 +1,126 @@
+"""
+Read replica routing.
+
+Read-only endpoints take their session from ``get_read_db`` /
+``get_async_read_db``, which pick a replica from DATABASE_REPLICA_URLS in
+round-robin order. A replica is only used while its replication lag, checked
+at most every REPLICA_CHECK_INTERVAL seconds, is within
+REPLICA_MAX_LAG_SECONDS; otherwise (or with no replicas configured) reads fall
+back to the primary. Writes, and reads that must see the caller's own writes,
+keep using ``get_db``.
+"""
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from cj36.core.config import settings, to_async_url
+from cj36.core.db_pool import engine_options, pool_status
+
+logger = logging.getLogger(__name__)
+
+# Seconds since the last replayed transaction, or 0 when the replica has replayed
+# everything it received (an idle primary does not advance the replay timestamp)
+POSTGRES_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_engine(url, **engine_options(url))
+        async_url = to_async_url(url)
+        self.async_engine = create_async_engine(async_url, **engine_options(async_url, is_async=True))
+        self.lag: Optional[float] = None  # None: unknown or unreachable
+        self.checked_at = float("-inf")
+
+    @property
+    def name(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+
+    def _lag_sql(self):
+        return POSTGRES_LAG_SQL if self.engine.dialect.name == "postgresql" else text("SELECT 0")
+
+    def _claim_check(self) -> bool:
+        """Whether a lag check is due; concurrent callers keep using the last result."""
+        now = time.monotonic()
+        if now - self.checked_at < settings.REPLICA_CHECK_INTERVAL:
+            return False
+        self.checked_at = now
+        return True
+
+    def _record(self, lag: Optional[float], error: Optional[Exception] = None) -> None:
+        if error is not None:
+            logger.warning(f"Read replica {self.name} unavailable: {error}")
+        self.lag = lag
+
+    def check(self) -> None:
+        if not self._claim_check():
+            return
+        try:
+            with self.engine.connect() as connection:
+                self._record(float(connection.execute(self._lag_sql()).scalar() or 0))
+        except Exception as e:
+            self._record(None, e)
+
+    async def check_async(self) -> None:
+        if not self._claim_check():
+            return
+        try:
+            async with self.async_engine.connect() as connection:
+                self._record(float((await connection.execute(self._lag_sql())).scalar() or 0))
+        except Exception as e:
+            self._record(None, e)
+
+    @property
+    def usable(self) -> bool:
+        return self.lag is not None and self.lag <= settings.REPLICA_MAX_LAG_SECONDS
+
+
+class ReplicaRouter:
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._next = itertools.count()
+
+    def _rotation(self) -> List[Replica]:
+        start = next(self._next) % len(self.replicas)
+        return self.replicas[start:] + self.replicas[:start]
+
+    def pick(self):
+        """A sync engine of a usable replica, or None to use the primary."""
+        for replica in self._rotation() if self.replicas else []:
+            replica.check()
+            if replica.usable:
+                return replica.engine
+        return None
+
+    async def pick_async(self):
+        """An async engine of a usable replica, or None to use the primary."""
+        for replica in self._rotation() if self.replicas else []:
+            await replica.check_async()
+            if replica.usable:
+                return replica.async_engine
+        return None
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "replica": replica.name,
+                "lag_seconds": replica.lag,
+                "usable": replica.usable,
+                "sync": pool_status(replica.engine),
+                "async": pool_status(replica.async_engine),
+            }
+            for replica in self.replicas
+        ]
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            replica.engine.dispose()
+            await replica.async_engine.dispose()
+
+
+replica_router = ReplicaRouter(settings.replica_urls)
@@ -0,0 +1,206 @@
+"""
+Full-text search over posts.
+
+Titles and descriptions are normalized and tokenized in Python (Bengali-aware)
+and stored in ``Post.search_text`` at write time. The database then does the
+inverted-index work:
+
+- PostgreSQL: GIN index on ``to_tsvector('simple', search_text)``, ranked with ts_rank
+- SQLite: an FTS5 table ``post_fts`` keyed by post id, ranked with bm25
+
+Snippets are highlighted in Python from the original description so both
+backends return identical markup.
+"""
+import html
+import logging
+import unicodedata
+from typing import List, Optional, Tuple
+from sqlalchemy import DDL, column, event, func, literal_column, table, text
+from sqlmodel import Session, select
+from cj36.models import Post
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "post_fts"
+fts_table = table(FTS_TABLE, column("rowid"), column("search_text"))
+# Must match the ix_post_search_text_fts expression for PostgreSQL to use the GIN index
+POST_SEARCH_VECTOR = func.to_tsvector(literal_column("'simple'"), Post.search_text)
+
+# unicode61 splits on combining marks by default, which would index Bengali words
+# as loose consonants; marks (vowel signs, hasanta, nukta) are word characters here,
+# matching tokenize()
+FTS_TOKENIZER = "unicode61 remove_diacritics 0 categories 'L* M* N* Co'"
+FTS_CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    f'USING fts5(search_text, tokenize = "{FTS_TOKENIZER}")'
+)
+
+ZERO_WIDTH = {"\u200c", "\u200d", "\u00ad", "\ufeff"}
+BENGALI_DIGITS = str.maketrans("\u09e6\u09e7\u09e8\u09e9\u09ea\u09eb\u09ec\u09ed\u09ee\u09ef", "0123456789")
+# ta + hasanta + ZWJ is the legacy spelling of khanda ta; the replacement is
+# padded with zero-width joiners so character offsets stay valid for snippets
+KHANDA_TA_LEGACY = "\u09a4\u09cd\u200d"
+KHANDA_TA_PADDED = "\u09ce\u200d\u200d"
+
+SNIPPET_TOKENS_BEFORE = 8
+SNIPPET_TOKENS_AFTER = 20
+
+
+# ---------- Normalization ----------
+def _normalize_token(token: str) -> str:
+    token = unicodedata.normalize("NFC", token)
+    token = "".join(ch for ch in token if ch not in ZERO_WIDTH)
+    return token.translate(BENGALI_DIGITS).casefold()
+
+
+def tokenize(value: Optional[str]) -> List[Tuple[int, int, str]]:
+    """
+    Split text into ``(start, end, normalized_token)`` spans.
+    Letters, combining marks (Bengali vowel signs, hasanta, nukta) and digits are
+    word characters; zero-width joiners inside a word are kept with it.
+    """
+    if not value:
+        return []
+    value = value.replace(KHANDA_TA_LEGACY, KHANDA_TA_PADDED)
+    spans = []
+    start = None
+    for i, ch in enumerate(value):
+        is_word = unicodedata.category(ch)[0] in "LMN" or (start is not None and ch in ZERO_WIDTH)
+        if is_word and start is None:
+            start = i
+        elif not is_word and start is not None:
+            spans.append((start, i, _normalize_token(value[start:i])))
+            start = None
+    if start is not None:
+        spans.append((start, len(value), _normalize_token(value[start:])))
+    return [span for span in spans if span[2]]
+
+
+def search_document(title: Optional[str], description: Optional[str]) -> str:
+    """The normalized, space-separated token stream stored in Post.search_text."""
+    return " ".join(token for _, _, token in tokenize(title) + tokenize(description))
+
+
+def index_post(db: Session, post: Post) -> None:
+    """
+    Refresh the search index entry for ``post`` inside the caller's transaction.
+    Call after changing title/description, before commit.
+    """
+    post.search_text = search_document(post.title, post.description)
+    if db.get_bind().dialect.name == "sqlite":
+        db.add(post)
+        db.flush()  # new posts need their id
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": post.id})
+        db.execute(
+            text(f"INSERT INTO {FTS_TABLE} (rowid, search_text) VALUES (:id, :search_text)"),
+            {"id": post.id, "search_text": post.search_text},
+        )
+
+
+def unindex_post(db: Session, post_id: int) -> None:
+    """Drop a deleted post from the SQLite FTS table (PostgreSQL indexes the row itself)."""
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": post_id})
+
+
+# The FTS5 table lives and dies with the post table, including in create_all/drop_all
+event.listen(
+    Post.__table__,
+    "after_create",
+    DDL(FTS_CREATE_SQL).execute_if(dialect="sqlite"),
+)
+event.listen(
+    Post.__table__,
+    "after_drop",
+    DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect="sqlite"),
+)
+
+
+def ensure_search_index(session: Session) -> None:
+    """
+    Make sure every post is indexed. Creates the SQLite FTS table on databases
+    that predate it (or rebuilds one with an outdated tokenizer) and backfills
+    posts written before search existed.
+    """
+    is_sqlite = session.get_bind().dialect.name == "sqlite"
+    if is_sqlite:
+        existing_sql = session.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).scalar()
+        if existing_sql is not None and FTS_TOKENIZER not in existing_sql:
+            logger.info("Rebuilding the search index with the current tokenizer")
+            session.execute(text(f"DROP TABLE {FTS_TABLE}"))
+        session.execute(text(FTS_CREATE_SQL))
+        fts_count = session.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar_one()
+        post_count = session.exec(select(func.count(Post.id))).one()
+        if fts_count != post_count:
+            session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+            pending = session.exec(select(Post)).all()
+        else:
+            pending = session.exec(select(Post).where(Post.search_text.is_(None))).all()
+    else:
+        pending = session.exec(select(Post).where(Post.search_text.is_(None))).all()
+
+    for post in pending:
+        index_post(session, post)
+    session.commit()
+    if pending:
+        logger.info(f"Indexed {len(pending)} post(s) for search")
+
+
+# ---------- Querying ----------
+def search_posts_query(db: Session, query_text: str) -> Tuple[object, object]:
+    """
+    Build ``(select(Post) with match filter, rank ordering)`` for ``query_text``.
+    Every query token must match as a word prefix. Returns (None, None) for an
+    empty query.
+    """
+    tokens = [token for _, _, token in tokenize(query_text)]
+    if not tokens:
+        return None, None
+
+    if db.get_bind().dialect.name == "postgresql":
+        ts_query = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{t}:*" for t in tokens))
+        rank = func.ts_rank(POST_SEARCH_VECTOR, ts_query)
+        return select(Post).where(POST_SEARCH_VECTOR.op("@@")(ts_query)), rank.desc()
+
+    match = " ".join(f'"{t}"*' for t in tokens)
+    query = (
+        select(Post)
+        .join(fts_table, fts_table.c.rowid == Post.id)
+        .where(text(f"{FTS_TABLE} MATCH :match").bindparams(match=match))
+    )
+    # bm25 is lower-is-better
+    return query, text(f"bm25({FTS_TABLE})")
+
+
+def highlight_snippet(value: Optional[str], query_text: str) -> str:
+    """
+    HTML-escaped excerpt of ``value`` around the first match, with matching
+    words wrapped in <mark>.
+    """
+    if not value:
+        return ""
+    query_tokens = [token for _, _, token in tokenize(query_text)]
+    spans = tokenize(value)
+    if not spans:
+        return html.escape(value)
+
+    matches = [i for i, (_, _, token) in enumerate(spans) if any(token.startswith(q) for q in query_tokens)]
+    first = max(0, (matches[0] if matches else 0) - SNIPPET_TOKENS_BEFORE)
+    last = min(len(spans), first + SNIPPET_TOKENS_BEFORE + SNIPPET_TOKENS_AFTER)
+
+    parts = ["\u2026"] if first > 0 else []
+    position = spans[first][0]
+    matched = set(matches)
+    for i in range(first, last):
+        start, end, _ = spans[i]
+        parts.append(html.escape(value[position:start]))
+        word = html.escape(value[start:end])
+        parts.append(f"<mark>{word}</mark>" if i in matched else word)
+        position = end
+    if last < len(spans):
+        parts.append("\u2026")
+    else:
+        parts.append(html.escape(value[position:]))
+    return "".join(parts)
@@ -4,7 +4,8 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from cj36.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with other rounds are flagged for rehash by verify_and_update
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = "HS256"
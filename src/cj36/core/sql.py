@@ -0,0 +1,16 @@
+"""
+Small SQL helpers shared across dialects (PostgreSQL in production, SQLite locally).
+"""
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def upsert_insert(dialect_name: str, table):
+    """
+    Return an INSERT construct for ``table`` that supports ``on_conflict_do_*``.
+    Raises NotImplementedError for dialects without INSERT ... ON CONFLICT.
+    """
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"INSERT ... ON CONFLICT is not supported on {dialect_name}")
@@ -0,0 +1,148 @@
+"""
+Serving /static.
+
+``CachedStaticFiles`` adds cache headers to Starlette's StaticFiles, which
+already answers ETag / Last-Modified revalidation with 304, serves byte ranges
+and hands whole files to the server via the ``http.response.pathsend``
+extension (sendfile) where the ASGI server supports it:
+
+- content-addressed uploads and their variants (``<sha256>[-<width>w].<ext>``)
+  never change, so they are sent with ``Cache-Control: public,
+  max-age=31536000, immutable`` and browsers and CDNs stop asking for them
+- everything else gets ``public, max-age=STATIC_MAX_AGE`` and is revalidated
+
+When the client accepts it, a precompressed ``.br`` or ``.gz`` sibling of the
+requested file is served as-is with the matching Content-Encoding, so text
+assets are never compressed per request. ``precompress`` (see
+precompress_static.py) writes those siblings; ``.br`` needs the optional
+``brotli`` package. /static is excluded from the dynamic GZip middleware.
+"""
+import gzip
+import os
+import re
+from mimetypes import guess_type
+from pathlib import Path
+from typing import List, Optional, Tuple
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+HASHED_NAME = re.compile(r"(^|/)[0-9a-f]{64}(-\d+w)?\.[a-z0-9]+$")
+
+# Preferred first
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+
+
+def accepted_encodings(header: str) -> set:
+    """Content codings accepted by an Accept-Encoding header (q=0 excluded)."""
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CachedStaticFiles(StaticFiles):
+    def __init__(self, *args, max_age: int = 3600, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_age = max_age
+
+    def _precompressed(self, full_path: str, accept_encoding: str) -> Tuple[bool, Optional[Tuple[str, str, os.stat_result]]]:
+        """Whether any sibling exists, and the best one the client accepts."""
+        accepted = accepted_encodings(accept_encoding)
+        found_any = False
+        for coding, suffix in PRECOMPRESSED:
+            try:
+                stat_result = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            found_any = True
+            if coding in accepted:
+                return True, (coding, full_path + suffix, stat_result)
+        return found_any, None
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = os.fspath(full_path)
+        headers = {
+            "Cache-Control": IMMUTABLE if HASHED_NAME.search(self.get_path(scope)) else f"public, max-age={self.max_age}"
+        }
+        media_type = guess_type(full_path)[0] or "text/plain"
+
+        has_siblings, sibling = self._precompressed(full_path, request_headers.get("accept-encoding", ""))
+        if has_siblings:
+            headers["Vary"] = "Accept-Encoding"
+        if sibling is not None:
+            coding, full_path, stat_result = sibling
+            headers["Content-Encoding"] = coding
+
+        response = FileResponse(
+            full_path, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_result
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class DynamicGZipMiddleware(GZipMiddleware):
+    """GZip for API responses; paths under ``exclude_prefix`` are passed through untouched."""
+
+    def __init__(self, app, exclude_prefix: str = "/static/", **kwargs):
+        super().__init__(app, **kwargs)
+        self.exclude_prefix = exclude_prefix
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_prefix):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def precompress(directory: Path, min_size: int = 1024) -> List[Path]:
+    """
+    Write ``.gz`` (and ``.br`` with brotli installed) siblings for compressible
+    files in ``directory`` that lack an up-to-date one; returns the files written.
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    written = []
+    for path in sorted(Path(directory).rglob("*")):
+        if not path.is_file() or path.suffix in (".gz", ".br"):
+            continue
+        media_type = guess_type(path.name)[0] or ""
+        if not media_type.startswith(COMPRESSIBLE_TYPES) or path.stat().st_size < min_size:
+            continue
+        data = None
+        for suffix, compress in ((".gz", lambda raw: gzip.compress(raw, 9, mtime=0)), (".br", brotli and brotli.compress)):
+            target = path.with_name(path.name + suffix)
+            if compress is None or (target.exists() and target.stat().st_mtime >= path.stat().st_mtime):
+                continue
+            data = data if data is not None else path.read_bytes()
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            partial = target.with_name(target.name + ".part")
+            partial.write_bytes(compressed)
+            os.replace(partial, target)
+            written.append(target)
+    return written
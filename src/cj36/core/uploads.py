@@ -0,0 +1,115 @@
+"""
+Content-addressed storage for uploaded images.
+
+Uploads are copied to disk in chunks while being hashed, then renamed to
+``static/images/<ab>/<cd>/<sha256><ext>``. Identical files therefore share one
+path (the second copy is simply discarded) and no directory grows without
+bound. Stored files never change, so their URLs can be cached forever.
+
+Size limits are enforced while reading: ``BodySizeLimitMiddleware`` rejects
+requests whose body exceeds UPLOAD_MAX_BYTES (plus room for the other form
+fields) from the Content-Length header or as the bytes arrive, before they
+are spooled, and ``store_image`` stops copying as soon as a file exceeds
+UPLOAD_MAX_BYTES.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from cj36.core.config import settings
+
+IMAGE_ROOT = Path("static/images")
+CHUNK_SIZE = 1024 * 1024
+# Room for the non-file form fields of an upload request
+FORM_OVERHEAD_BYTES = 1024 * 1024
+
+ALLOWED_IMAGE_EXTENSIONS = {".jpg", ".png", ".gif", ".webp", ".avif"}
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg"}
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Upload exceeds the {settings.UPLOAD_MAX_BYTES} byte limit",
+    )
+
+
+def image_extension(filename: str) -> str:
+    extension = Path(filename or "").suffix.lower()
+    extension = EXTENSION_ALIASES.get(extension, extension)
+    if extension not in ALLOWED_IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported image type")
+    return extension
+
+
+def store_image(upload: UploadFile, root: Path = IMAGE_ROOT) -> str:
+    """Store ``upload`` under its content hash; returns the path to save on the post."""
+    extension = image_extension(upload.filename)
+    incoming = root / ".incoming"
+    incoming.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_name = tempfile.mkstemp(dir=incoming)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := upload.file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.UPLOAD_MAX_BYTES:
+                    raise _too_large()
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty upload")
+
+        name = digest.hexdigest()
+        target = root / name[:2] / name[2:4] / f"{name}{extension}"
+        if target.exists():
+            # Already stored by an earlier upload
+            os.unlink(temp_name)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.chmod(temp_name, 0o644)
+            os.replace(temp_name, target)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+        raise
+    return target.as_posix()
+
+
+class BodySizeLimitMiddleware:
+    """Rejects request bodies larger than ``max_bytes`` without reading them in full."""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse(status_code=413, content={"detail": "Request body too large"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def request_max_bytes() -> int:
+    return settings.UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES
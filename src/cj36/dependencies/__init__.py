@@ -1,13 +1,26 @@
-from typing import Generator, List, Optional
+from typing import AsyncGenerator, Generator, List, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlmodel import Session, create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from cj36.core.config import settings
+from cj36.core.cache import user_cache
+from cj36.core.db_pool import engine_options
+from cj36.core.replicas import replica_router
 from cj36.core.security import ALGORITHM, SECRET_KEY
 from cj36.models import User, UserType, AdminType
+import cj36.core.category_counts  # noqa: F401  (registers post count flush listeners)
+import cj36.core.comment_counts  # noqa: F401  (registers comment count flush listeners)
+import cj36.core.publishing  # noqa: F401  (registers the unpublish flush listener)
 
-engine = create_engine(settings.db_url)
+# Sync engine: sync endpoints (run in the threadpool), scheduler and scripts
+engine = create_engine(settings.db_url, **engine_options(settings.db_url))
+# Async engine (asyncpg / aiosqlite): hot read endpoints run on the event loop
+async_engine = create_async_engine(settings.async_db_url, **engine_options(settings.async_db_url, is_async=True))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/users/token", auto_error=False)
 
@@ -17,40 +30,142 @@ def get_db() -> Generator:
         yield session
 
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> User:
-    credentials_exception = HTTPException(
+async def get_async_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+def get_read_db(db: Session = Depends(get_db)) -> Generator:
+    """
+    Session for read-only endpoints: a replica within the staleness tolerance,
+    or the primary session when there is none.
+    """
+    replica_engine = replica_router.pick()
+    if replica_engine is None:
+        yield db
+        return
+    with Session(replica_engine, info={"replica": True}) as session:
+        yield session
+
+
+async def get_async_read_db(db: AsyncSession = Depends(get_async_db)) -> AsyncGenerator:
+    """get_read_db for async endpoints."""
+    replica_engine = await replica_router.pick_async()
+    if replica_engine is None:
+        yield db
+        return
+    async with AsyncSession(replica_engine, expire_on_commit=False, info={"replica": True}) as session:
+        yield session
+
+
+def username_from_token(token: Optional[str]) -> Optional[str]:
+    """The subject of a valid access token, or None."""
+    if token is None:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
+
+
+def _blocked_exception() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is blocked")
+
+
+# ---------- Cached user resolution ----------
+# Tokens resolve to users through user_cache (cj36.core.cache), so authenticated
+# requests normally cost no query. Cached users are rebuilt from a column
+# snapshot; sync endpoints get them attached to their session without a SELECT.
+def cached_user(username: str) -> Optional[User]:
+    """A detached User rebuilt from the cache, or None on a miss."""
+    snapshot = user_cache.get(username)
+    if snapshot is None:
+        return None
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return user
+
+
+def remember_user(user: Optional[User], generation: int) -> None:
+    if user is not None:
+        user_cache.set(user.username, user.model_dump(), generation)
+
+
+def resolve_user(db: Session, username: Optional[str]) -> Optional[User]:
+    """The User for a token subject, attached to ``db``."""
+    if username is None:
+        return None
+    user = cached_user(username)
+    if user is not None:
+        return db.merge(user, load=False)
+    generation = user_cache.generation
+    user = db.exec(select(User).where(User.username == username)).first()
+    remember_user(user, generation)
+    return user
+
+
+async def resolve_user_async(db: AsyncSession, username: Optional[str]) -> Optional[User]:
+    """resolve_user for async endpoints (the user is returned detached)."""
+    if username is None:
+        return None
+    user = cached_user(username)
+    if user is not None:
+        return user
+    generation = user_cache.generation
+    user = (await db.exec(select(User).where(User.username == username))).first()
+    remember_user(user, generation)
+    return user
+
+
+def get_current_user(
+    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+) -> User:
+    user = resolve_user(db, username_from_token(token))
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    if user.is_blocked:
+        raise _blocked_exception()
     return user
 
 
-async def get_optional_current_user(
+def get_optional_current_user(
     db: Session = Depends(get_db), token: Optional[str] = Depends(oauth2_scheme)
 ) -> Optional[User]:
-    if token is None:
+    user = resolve_user(db, username_from_token(token))
+    # Blocked users read as anonymous
+    if user is None or user.is_blocked:
         return None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-    except JWTError:
+    return user
+
+
+async def get_current_user_async(
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
+) -> User:
+    """get_current_user for async endpoints."""
+    user = await resolve_user_async(db, username_from_token(token))
+    if user is None:
+        raise _credentials_exception()
+    if user.is_blocked:
+        raise _blocked_exception()
+    return user
+
+
+async def get_optional_current_user_async(
+    db: AsyncSession = Depends(get_async_db), token: Optional[str] = Depends(oauth2_scheme)
+) -> Optional[User]:
+    """get_optional_current_user for async endpoints."""
+    user = await resolve_user_async(db, username_from_token(token))
+    if user is None or user.is_blocked:
         return None
-    user = db.query(User).filter(User.username == username).first()
     return user
 
 
@@ -59,7 +174,7 @@ class AdminChecker:
     def __init__(self, allowed_admin_types: List[str]):
         self.allowed_admin_types = allowed_admin_types
 
-    def __call__(self, current_user: User = Depends(get_current_user)):
+    def check(self, current_user: User) -> User:
         # Check if user is an administrator
         if current_user.user_type != UserType.ADMINISTRATOR:
             raise HTTPException(
@@ -75,6 +190,15 @@ class AdminChecker:
             )
         return current_user
 
+    def __call__(self, current_user: User = Depends(get_current_user)):
+        return self.check(current_user)
+
+
+class AsyncAdminChecker(AdminChecker):
+    """AdminChecker for async endpoints (the user is returned detached)."""
+    async def __call__(self, current_user: User = Depends(get_current_user_async)):
+        return self.check(current_user)
+
 
 # Backward compatibility
 class RoleChecker(AdminChecker):
@@ -4,11 +4,18 @@ from contextlib import asynccontextmanager
 from sqlmodel import SQLModel, Session
 from cj36.core.config import settings
 from cj36.api.v1.router import api_router
-from cj36.dependencies import engine
+from cj36.dependencies import engine, async_engine
+from cj36.core.replicas import replica_router
+from cj36.core.password_hashing import hashing_pool
+from cj36.core.email import outbox_sender
+from cj36.core.images import image_pipeline
+from cj36.core.uploads import BodySizeLimitMiddleware, request_max_bytes
+from cj36.core.static_files import CachedStaticFiles, DynamicGZipMiddleware
+from cj36.core.rate_limit import rate_limiter
 from cj36.core.seed import seed_database
+from cj36.core.category_counts import reconcile_category_counts
+from cj36.core.search import ensure_search_index
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.staticfiles import StaticFiles
 from cj36.scheduler import start_scheduler, shutdown_scheduler
 import time
 
@@ -23,14 +30,23 @@ async def lifespan(app: FastAPI):
     create_db_and_tables()
     with Session(engine) as session:
         seed_database(session)
+        reconcile_category_counts(session)
+        ensure_search_index(session)
     
     # Start background scheduler for scheduled posts
     start_scheduler()
+    # Deliver queued email in the background
+    outbox_sender.start(engine)
     
     yield
     
     # Shutdown
     shutdown_scheduler()
+    outbox_sender.stop()
+    hashing_pool.shutdown()
+    image_pipeline.shutdown()
+    await async_engine.dispose()
+    await replica_router.dispose()
 
 
 app = FastAPI(
@@ -59,9 +75,7 @@ async def add_security_headers(request: Request, call_next):
     
     return response
 
-# Rate Limiting Middleware (Simple implementation)
-rate_limit_storage = {}
-
+# Rate Limiting Middleware (sliding window counters, see cj36.core.rate_limit)
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
     # Skip rate limiting for health checks and static files
@@ -69,25 +83,18 @@ async def rate_limit_middleware(request: Request, call_next):
         return await call_next(request)
     
     client_ip = request.client.host if request.client else "unknown"
-    current_time = time.time()
-    
-    # Clean old entries (older than 1 minute)
-    rate_limit_storage[client_ip] = [
-        timestamp for timestamp in rate_limit_storage.get(client_ip, [])
-        if current_time - timestamp < 60
-    ]
-    
-    # Check rate limit (100 requests per minute)
-    if len(rate_limit_storage.get(client_ip, [])) >= 100:
+    decision = await rate_limiter.check(request.method, request.url.path, client_ip, time.time())
+    if not decision.allowed:
         return JSONResponse(
             status_code=429,
-            content={"detail": "Too many requests. Please try again later."}
+            content={"detail": "Too many requests. Please try again later."},
+            headers={"Retry-After": str(decision.retry_after), "X-RateLimit-Limit": str(decision.limit)},
         )
     
-    # Add current request
-    rate_limit_storage.setdefault(client_ip, []).append(current_time)
-    
-    return await call_next(request)
+    response = await call_next(request)
+    response.headers["X-RateLimit-Limit"] = str(decision.limit)
+    response.headers["X-RateLimit-Remaining"] = str(decision.remaining)
+    return response
 
 # CORS middleware with proper configuration
 app.add_middleware(
@@ -96,17 +103,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
-# GZip compression for responses
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# GZip compression for API responses (/static serves precompressed files)
+app.add_middleware(DynamicGZipMiddleware, minimum_size=1000)
+
+# Reject oversized uploads before they are spooled
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=request_max_bytes())
 
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 # Serve static files with cache headers
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static", max_age=settings.STATIC_MAX_AGE), name="static")
 
 
 @app.get("/")
@@ -126,12 +137,12 @@ async def health_check():
 
 
 @app.get("/health/scheduler")
-async def scheduler_health():
-    """Check if the background scheduler is running"""
-    from cj36.scheduler import scheduler
+def scheduler_health():
+    """Check which worker leads the background scheduler and whether it is running here"""
+    from cj36.scheduler import leader_election, scheduler, scheduler_running
     
     jobs = []
-    if scheduler.running:
+    if scheduler_running():
         jobs = [
             {
                 "id": job.id,
@@ -141,8 +152,16 @@ async def scheduler_health():
             for job in scheduler.get_jobs()
         ]
     
+    election = leader_election.status()
+    if scheduler_running():
+        status = "healthy"
+    elif election["leader"] is not None and not election["is_leader"]:
+        status = "standby"
+    else:
+        status = "stopped"
     return {
-        "scheduler_running": scheduler.running,
+        **election,
+        "scheduler_running": scheduler_running(),
         "jobs": jobs,
-        "status": "healthy" if scheduler.running else "stopped"
+        "status": status
     }
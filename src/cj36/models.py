@@ -1,5 +1,6 @@
 from typing import List, Optional, Dict
 from sqlmodel import Field, Relationship, SQLModel
+from sqlalchemy import JSON, Column, Index, Text, text
 import datetime
 import enum
 
@@ -30,6 +31,12 @@ class PostStatus(str, enum.Enum):
     SCHEDULED = "scheduled"
 
 
+class EmailStatus(str, enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
 class UserBase(SQLModel):
     username: str = Field(index=True, unique=True)
     email: Optional[str] = Field(default=None, index=True)
@@ -120,6 +127,18 @@ class CategoryRead(CategoryBase):
     parent_id: Optional[int] = None
 
 
+class CategoryTreeNode(CategoryRead):
+    # Published posts filed under this category
+    post_count: int = 0
+    subcategories: List["CategoryTreeNode"] = []
+
+
+class CategoryTreeResponse(SQLModel):
+    # Content checksum; changes whenever the tree or its counts change
+    version: int
+    categories: List[CategoryTreeNode]
+
+
 class PostBase(SQLModel):
     title: str
     description: str
@@ -132,7 +151,11 @@ class PostBase(SQLModel):
 class Post(PostBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
-    last_modified: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    # Bumped on every UPDATE of the row; drives /posts/sync delta tokens
+    last_modified: datetime.datetime = Field(
+        default_factory=datetime.datetime.utcnow,
+        sa_column_kwargs={"onupdate": datetime.datetime.utcnow},
+    )
 
     author_id: int = Field(foreign_key="user.id")
     author: User = Relationship(back_populates="posts")
@@ -142,6 +165,52 @@ class Post(PostBase, table=True):
 
     topics: List[Category] = Relationship(back_populates="topic_posts", link_model=PostCategoryLink)
 
+    # Normalized title + description tokens, maintained by cj36.core.search
+    search_text: Optional[str] = Field(default=None, sa_column=Column(Text))
+
+    # Resized copies of an uploaded image, built by cj36.core.images
+    image_variants: Optional[List[Dict]] = Field(default=None, sa_column=Column(JSON(none_as_null=True)))
+
+    # When the post last left PUBLISHED (set by cj36.core.publishing); delta
+    # feeds only report hidden posts as deletions to clients that could see them
+    unpublished_at: Optional[datetime.datetime] = Field(default=None)
+
+    # Maintained on every comment write by cj36.core.comment_counts
+    comments_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+    __table_args__ = (
+        # Keyset pagination order for the newest-first feed
+        Index("ix_post_created_at_id", "created_at", "id"),
+        # Delta sync order (changes since a watermark)
+        Index("ix_post_last_modified_id", "last_modified", "id"),
+        # Due scheduled posts (cj36.core.publishing)
+        Index("ix_post_status_scheduled_at", "status", "scheduled_at"),
+        # Uploads are stored by content hash; finds posts sharing a file
+        Index("ix_post_image", "image"),
+        # Full-text search (PostgreSQL); SQLite uses the FTS5 table from cj36.core.search
+        Index(
+            "ix_post_search_text_fts",
+            text("to_tsvector('simple', search_text)"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+# Published post count per category, maintained incrementally on every post
+# write by cj36.core.category_counts so /posts/sync never aggregates the post table.
+class CategoryPostCount(SQLModel, table=True):
+    category_id: int = Field(primary_key=True)
+    post_count: int = Field(default=0)
+
+
+# Records deleted posts so /posts/sync can report deletions to clients
+class PostTombstone(SQLModel, table=True):
+    post_id: int = Field(primary_key=True)
+    deleted_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, index=True)
+    # Whether the post was ever public; deletions of drafts only reach their author and staff
+    was_published: bool = Field(default=True)
+    author_id: Optional[int] = None
+
 
 class PostCreate(PostBase):
     topic_ids: List[int]
@@ -163,6 +232,12 @@ class PostUpdate(SQLModel):
 
 
 
+class ImageVariant(SQLModel):
+    width: int
+    format: str
+    url: str
+
+
 class PostRead(PostBase):
     id: int
     created_at: datetime.datetime
@@ -171,11 +246,24 @@ class PostRead(PostBase):
     category: Optional[CategoryRead] = None
     topics: List[CategoryRead] = []
     status: Optional[PostStatus] = None
+    # None while the variants of an uploaded image are still being built
+    image_variants: Optional[List[ImageVariant]] = None
+    comments_count: int = 0
+
+
+class PostSearchResult(SQLModel):
+    post: PostRead
+    # HTML-escaped description excerpt with matches wrapped in <mark>
+    snippet: str
 
 
 class PostSyncResponse(SQLModel):
     posts: List[PostRead]
     category_counts: Dict[int, int]
+    # Delta sync (only filled when the request passes `since`)
+    deleted_ids: List[int] = []
+    next_token: Optional[str] = None
+    has_more: bool = False
 
 
 # Comment Models
@@ -189,6 +277,12 @@ class Comment(CommentBase, table=True):
     
     post_id: int = Field(foreign_key="post.id")
     author_id: int = Field(foreign_key="user.id")
+    author: User = Relationship()
+
+    __table_args__ = (
+        # A post's comments, newest first, in keyset pages
+        Index("ix_comment_post_id_created_at_id", "post_id", "created_at", "id"),
+    )
 
 
 class CommentCreate(CommentBase):
@@ -209,8 +303,12 @@ class Bookmark(SQLModel, table=True):
     
     post_id: int = Field(foreign_key="post.id")
     user_id: int = Field(foreign_key="user.id")
+
+    post: "Post" = Relationship()
     
     __table_args__ = (
+        # One bookmark per user and post; bookmark sync inserts with ON CONFLICT DO NOTHING
+        Index("ix_bookmark_user_id_post_id", "user_id", "post_id", unique=True),
         {"sqlite_autoincrement": True},
     )
 
@@ -224,3 +322,42 @@ class BookmarkRead(SQLModel):
     created_at: datetime.datetime
     post: PostRead
 
+
+
+# Outgoing mail; request handlers enqueue, cj36.core.email's sender delivers
+class EmailOutbox(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    to_email: str
+    subject: str
+    html_content: str = Field(sa_column=Column(Text, nullable=False))
+    status: EmailStatus = Field(default=EmailStatus.PENDING)
+    attempts: int = Field(default=0)
+    # Earliest time of the next attempt; also the lease of a batch being sent
+    next_attempt_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    last_error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    sent_at: Optional[datetime.datetime] = Field(default=None)
+
+    __table_args__ = (
+        # Due messages, oldest first
+        Index("ix_emailoutbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+
+# One daily newsletter digest; progress is kept so an interrupted run resumes
+# where it stopped (see cj36.core.newsletter)
+class NewsletterRun(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    digest_date: datetime.date = Field(unique=True)
+    subject: str
+    html_content: str = Field(sa_column=Column(Text, nullable=False))
+    completed: bool = Field(default=False)
+    # Keyset position: subscribers with id <= last_user_id have been handled
+    last_user_id: int = Field(default=0)
+    sent_count: int = Field(default=0)
+    # Failed sends handed to the email outbox for retry
+    deferred_count: int = Field(default=0)
+    started_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    # Heartbeat of the worker sending the run
+    updated_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    finished_at: Optional[datetime.datetime] = Field(default=None)
@@ -4,11 +4,19 @@ This runs within the FastAPI application and works on both cPanel and VPS.
 """
 import logging
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 import datetime
-from sqlmodel import Session, select
+from sqlmodel import Session
 from cj36.dependencies import engine
-from cj36.models import Post, PostStatus
+from cj36.core.category_counts import reconcile_category_counts
+from cj36.core.comment_counts import reconcile_comment_counts
+from cj36.core.config import settings
+from cj36.core.images import image_pipeline
+from cj36.core.leader import LeaderElection, create_lock
+from cj36.core.newsletter import send_digest
+from cj36.core.publishing import next_due_at, publish_due_posts, publish_timer, publish_wakeup
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,64 +28,164 @@ scheduler = BackgroundScheduler()
 
 def publish_scheduled_posts():
     """
-    Check for scheduled posts that are due and publish them.
-    This function runs every minute via the scheduler.
+    Publish all scheduled posts that are due and re-arm the timer for the next one.
+    Runs at the armed scheduled_at via publish_timer, when another worker commits
+    a schedule (publish_wakeup), and every SCHEDULER_PUBLISH_POLL seconds as a
+    safety net for lost wakeups.
     """
     try:
         with Session(engine) as session:
-            now = datetime.datetime.utcnow()
-            
-            # Find all posts with status SCHEDULED and scheduled_at <= now
-            query = select(Post).where(
-                Post.status == PostStatus.SCHEDULED,
-                Post.scheduled_at <= now,
-                Post.scheduled_at.is_not(None)
-            )
-            
-            due_posts = session.exec(query).all()
-            
-            if not due_posts:
-                logger.debug(f"[{now.isoformat()}] No scheduled posts due for publication.")
-                return
-            
-            logger.info(f"[{now.isoformat()}] Found {len(due_posts)} scheduled post(s) to publish:")
-            
-            for post in due_posts:
-                logger.info(f"  - Publishing post #{post.id}: '{post.title[:50]}...'")
-                post.status = PostStatus.PUBLISHED
-                session.add(post)
-            
-            session.commit()
-            logger.info(f"[{now.isoformat()}] Successfully published {len(due_posts)} post(s).")
-            
+            published = publish_due_posts(session)
+            if published:
+                logger.info(f"Published {len(published)} scheduled post(s): {published}")
+            publish_timer.arm(next_due_at(session))
     except Exception as e:
         logger.error(f"Error publishing scheduled posts: {e}", exc_info=True)
 
 
-def start_scheduler():
+def reconcile_counts():
+    """
+    Rebuild the per-category published post counts and per-post comment counts.
+    They are maintained on every write; this only repairs drift from raw SQL edits.
+    """
+    try:
+        with Session(engine) as session:
+            reconcile_category_counts(session)
+            fixed = reconcile_comment_counts(session)
+        if fixed:
+            logger.info(f"Repaired comment counts of {fixed} post(s).")
+    except Exception as e:
+        logger.error(f"Error reconciling category counts: {e}", exc_info=True)
+
+
+def queue_missing_image_variants():
     """
-    Start the background scheduler.
-    Called when the FastAPI application starts.
+    Queue variant generation for uploaded images that have none yet,
+    e.g. because the worker restarted while they were queued.
     """
-    # Add job to run every minute
+    try:
+        with Session(engine) as session:
+            queued = image_pipeline.queue_missing(session)
+        if queued:
+            logger.info(f"Queued image variants for {queued} post(s).")
+    except Exception as e:
+        logger.error(f"Error queueing image variants: {e}", exc_info=True)
+
+
+def send_newsletter_digest():
+    """
+    Send the digest of yesterday's posts once NEWSLETTER_SEND_HOUR (UTC) has passed.
+    Runs hourly, so an interrupted run is resumed on a later tick.
+    """
+    try:
+        now = datetime.datetime.utcnow()
+        if now.hour < settings.NEWSLETTER_SEND_HOUR:
+            return
+        run = send_digest(engine, now.date() - datetime.timedelta(days=1))
+        if run is not None:
+            logger.info(
+                f"Newsletter digest for {run.digest_date} sent to {run.sent_count} subscriber(s), "
+                f"{run.deferred_count} deferred to the email outbox."
+            )
+    except Exception as e:
+        logger.error(f"Error sending newsletter digest: {e}", exc_info=True)
+
+
+def scheduler_running() -> bool:
+    """Whether this worker's scheduler is running jobs (not stopped or paused as a follower)."""
+    return scheduler.state == STATE_RUNNING
+
+
+def _start_jobs():
+    """Add the jobs and start (or resume) the scheduler; runs once this worker is elected leader."""
+    # Scheduled posts are published by a one-shot job armed for the next
+    # scheduled_at; other workers wake this one to re-arm it, and the interval
+    # job only catches wakeups that got lost
+    publish_timer.attach(scheduler, publish_scheduled_posts)
     scheduler.add_job(
         func=publish_scheduled_posts,
-        trigger=IntervalTrigger(minutes=1),
+        trigger=IntervalTrigger(seconds=settings.SCHEDULER_PUBLISH_POLL),
         id='publish_scheduled_posts',
         name='Publish scheduled posts',
+        next_run_time=datetime.datetime.now(datetime.timezone.utc),
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=reconcile_counts,
+        trigger=IntervalTrigger(hours=1),
+        id='reconcile_category_counts',
+        name='Reconcile category post counts',
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=queue_missing_image_variants,
+        trigger=IntervalTrigger(hours=1),
+        id='queue_missing_image_variants',
+        name='Queue missing image variants',
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=send_newsletter_digest,
+        trigger=CronTrigger(minute=5),
+        id='send_newsletter_digest',
+        name='Send newsletter digest',
         replace_existing=True
     )
     
-    scheduler.start()
+    # A deposed leader's scheduler is only paused: shutdown() also shuts down
+    # its executor, and a restarted instance could not run any job
+    if scheduler.state == STATE_PAUSED:
+        scheduler.resume()
+    else:
+        scheduler.start()
+    publish_wakeup.start(publish_scheduled_posts)
     logger.info("✅ Background scheduler started successfully")
-    logger.info("📅 Scheduled job: Publish posts every 1 minute")
+    logger.info(
+        "📅 Scheduled job: Publish posts at their scheduled time "
+        f"(checked every {settings.SCHEDULER_PUBLISH_POLL:g} seconds)"
+    )
+    logger.info("📅 Scheduled job: Reconcile category and comment counts every 1 hour")
+    logger.info("📅 Scheduled job: Queue missing image variants every 1 hour")
+    logger.info(f"📅 Scheduled job: Newsletter digest daily from {settings.NEWSLETTER_SEND_HOUR:02d}:05 UTC")
+
+
+def _stop_jobs():
+    """Drop the jobs and pause the scheduler; runs when this worker stops being leader."""
+    publish_wakeup.stop()
+    if scheduler_running():
+        publish_timer.attach(None, None)
+        scheduler.remove_all_jobs()
+        scheduler.pause()
+        logger.info("🛑 Background scheduler paused")
+
+
+# Only the elected worker runs the scheduler (see cj36.core.leader)
+leader_election = LeaderElection(
+    create_lock(settings.db_url, settings.SCHEDULER_LOCK_PATH),
+    on_elected=_start_jobs,
+    on_deposed=_stop_jobs,
+    retry_interval=settings.SCHEDULER_LEADER_RETRY,
+)
+
+
+def start_scheduler():
+    """
+    Start campaigning for scheduler leadership.
+    Called when the FastAPI application starts; the worker that wins the
+    lock starts the background scheduler, the others stand by.
+    """
+    leader_election.start()
 
 
 def shutdown_scheduler():
     """
-    Shutdown the background scheduler.
+    Shutdown the background scheduler and hand leadership to another worker.
     Called when the FastAPI application shuts down.
     """
+    leader_election.stop()
     if scheduler.running:
         scheduler.shutdown()
         logger.info("🛑 Background scheduler shut down")
@@ -1,13 +1,48 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import smtplib
+import socket
+import threading
 import pytest
+from fastapi import FastAPI, Request
 from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine, select
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from cj36.main import app
-from cj36.dependencies import get_db
+from cj36.core.rate_limit import rate_limiter, RateLimit, RateLimiter, SQLiteBackend, MemoryBackend, slide
+from cj36.dependencies import get_db, get_async_db
 from cj36.core.config import settings
-from cj36.models import User, UserCreate, Role, Post, PostCreate, PostStatus, Category, CategoryCreate
-from cj36.core.security import get_password_hash
+from cj36.models import User, UserCreate, Role, Post, PostCreate, PostStatus, Category, CategoryCreate, UserType, AdminType, EmailOutbox, EmailStatus
+from cj36.core.security import get_password_hash, pwd_context
+from cj36.core.cache import feed_cache, user_cache
+from cj36.core.category_tree import category_tree
+from cj36.core.replicas import Replica, replica_router
+from cj36.core.password_hashing import hashing_pool
+from cj36.core.email import SMTPConnection, claim_due_emails, enqueue_email, process_outbox
+from cj36.core.newsletter import SMTPPool, send_digest, start_run
+from cj36.core.images import ImagePipeline
+from cj36.core.uploads import BodySizeLimitMiddleware
+from cj36.core.static_files import CachedStaticFiles, precompress
+from cj36.core.publishing import FileWakeup, next_due_at, publish_due_posts, publish_timer
+import cj36.core.publishing as publishing_module
+from cj36.core.leader import FileLock, LeaderElection, SoleWorker
+import cj36.scheduler as scheduler_module
+from cj36.core.post_stream import PostChange, PostChangeFeed, Subscriber
+from cj36.core.pagination import decode_cursor
+from cj36.core.comment_counts import reconcile_comment_counts
+from apscheduler.schedulers.background import BackgroundScheduler
+import cj36.api.v1.posts as posts_api
+from passlib.context import CryptContext
 
 engine = create_engine(settings.db_url)
+# TestClient runs each request on a fresh event loop, so async connections are not pooled
+async_engine = create_async_engine(settings.async_db_url, poolclass=NullPool)
 
 @pytest.fixture(name="session")
 def session_fixture():
@@ -21,7 +56,17 @@ def client_fixture(session: Session):
     def override_get_db():
         yield session
 
+    async def override_get_async_db():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    # The per-IP limiter is process-wide; start every test with a fresh budget
+    rate_limiter.reset()
+    feed_cache.clear()
+    user_cache.clear()
+    category_tree.invalidate()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
@@ -568,3 +613,1030 @@ def test_create_post_with_image(client: TestClient, writer_token: str, tmp_path)
     assert post["image"] is not None
     assert "static/images" in post["image"]
     assert post["title"] == "Post with Image"
+
+
+# Helpers for verified administrator accounts (login requires is_verified)
+def create_admin_in_db(session: Session, username, password, admin_type, post_review_before_publish=False):
+    user = User(
+        username=username,
+        hashed_password=get_password_hash(password),
+        user_type=UserType.ADMINISTRATOR,
+        admin_type=admin_type,
+        post_review_before_publish=post_review_before_publish,
+        is_verified=True,
+    )
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    return user
+
+def auth_headers(client: TestClient, username, password):
+    response = client.post("/api/v1/users/token", data={"username": username, "password": password})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture(name="editor_headers")
+def editor_headers_fixture(client: TestClient, session: Session):
+    create_admin_in_db(session, "editor", "pass", AdminType.ADMIN)
+    return auth_headers(client, "editor", "pass")
+
+# Keyset Pagination Tests
+def test_read_posts_cursor_pagination(client: TestClient, editor_headers: dict):
+    cat = create_category_helper(client, "Cursor Cat", headers=editor_headers).json()
+    for i in range(5):
+        create_post_helper(client, f"Cursor Post {i}", "Desc", [cat["id"]], cat["id"], editor_headers)
+
+    response = client.get("/api/v1/posts/?limit=2")
+    assert response.status_code == 200
+    seen = [post["id"] for post in response.json()]
+    cursor = response.headers["X-Next-Cursor"]
+    while cursor:
+        response = client.get(f"/api/v1/posts/?limit=2&cursor={cursor}")
+        assert response.status_code == 200
+        seen.extend(post["id"] for post in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+
+    # Every post exactly once, newest first
+    assert len(seen) == 5
+    assert seen == sorted(seen, reverse=True)
+
+def test_read_posts_invalid_cursor(client: TestClient):
+    response = client.get("/api/v1/posts/?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+
+# Query Count Tests
+class QueryCounter:
+    """Count SQL statements executed on the test engine."""
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self._before_execute)
+
+def count_queries(client: TestClient, url: str):
+    with QueryCounter() as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    return counter.count
+
+def test_post_endpoints_query_count_is_constant(client: TestClient, editor_headers: dict):
+    parent = create_category_helper(client, "Query Parent", headers=editor_headers).json()
+    topic_a = create_category_helper(client, "Query Topic A", parent_id=parent["id"], headers=editor_headers).json()
+    topic_b = create_category_helper(client, "Query Topic B", parent_id=parent["id"], headers=editor_headers).json()
+
+    def add_posts(n):
+        for i in range(n):
+            create_post_helper(client, f"Query Post {i}", "Desc", [topic_a["id"], topic_b["id"]], parent["id"], editor_headers)
+
+    add_posts(2)
+    small = {url: count_queries(client, url) for url in ["/api/v1/posts/", "/api/v1/posts/sync"]}
+    add_posts(8)
+    large = {url: count_queries(client, url) for url in ["/api/v1/posts/", "/api/v1/posts/sync"]}
+
+    # posts + author + category + topics, independent of page size
+    assert large == small
+    assert large["/api/v1/posts/"] <= 4
+    post_id = client.get("/api/v1/posts/").json()[0]["id"]
+    assert count_queries(client, f"/api/v1/posts/{post_id}") <= 4
+
+
+# Category Count Tests
+def test_sync_category_counts_follow_post_writes(client: TestClient, editor_headers: dict, session: Session):
+    cat1 = create_category_helper(client, "Count Cat 1", headers=editor_headers).json()
+    cat2 = create_category_helper(client, "Count Cat 2", headers=editor_headers).json()
+
+    def counts():
+        return {int(k): v for k, v in client.get("/api/v1/posts/sync").json()["category_counts"].items()}
+
+    post = create_post_helper(client, "Counted", "Desc", [cat1["id"]], cat1["id"], editor_headers).json()
+    create_post_helper(client, "Counted 2", "Desc", [cat1["id"]], cat1["id"], editor_headers)
+    assert counts() == {cat1["id"]: 2}
+
+    # Move to another category
+    client.put(f"/api/v1/posts/{post['id']}", data={"category_id": cat2["id"]}, headers=editor_headers)
+    assert counts() == {cat1["id"]: 1, cat2["id"]: 1}
+
+    # Unpublish
+    client.put(f"/api/v1/posts/{post['id']}", data={"status": PostStatus.DRAFT.value}, headers=editor_headers)
+    assert counts() == {cat1["id"]: 1}
+
+    # Publish via the scheduler path (plain ORM update)
+    db_post = session.get(Post, post["id"])
+    db_post.status = PostStatus.PUBLISHED
+    session.add(db_post)
+    session.commit()
+    assert counts() == {cat1["id"]: 1, cat2["id"]: 1}
+
+    client.delete(f"/api/v1/posts/{post['id']}", headers=editor_headers)
+    assert counts() == {cat1["id"]: 1}
+
+
+# Delta Sync Tests
+def test_delta_sync_reports_updates_and_deletions(client: TestClient, editor_headers: dict):
+    cat = create_category_helper(client, "Delta Cat", headers=editor_headers).json()
+    post_a = create_post_helper(client, "Delta A", "Desc", [cat["id"]], cat["id"], editor_headers).json()
+    post_b = create_post_helper(client, "Delta B", "Desc", [cat["id"]], cat["id"], editor_headers).json()
+    draft = client.post(
+        "/api/v1/posts/",
+        data={"title": "Delta draft", "description": "Desc", "category_id": cat["id"], "topic_ids": [cat["id"]], "status": PostStatus.DRAFT.value},
+        headers=editor_headers,
+    ).json()
+
+    # Initial full sync, paged one row at a time
+    token, seen, has_more = "", [], True
+    while has_more:
+        body = client.get("/api/v1/posts/sync", params={"since": token, "limit": 1}).json()
+        seen.extend(post["id"] for post in body["posts"])
+        assert body["deleted_ids"] == []
+        token, has_more = body["next_token"], body["has_more"]
+    assert sorted(seen) == sorted([post_a["id"], post_b["id"]])
+
+    response = client.put(f"/api/v1/posts/{post_a['id']}", data={"title": "Delta A edited"}, headers=editor_headers)
+    assert response.json()["last_modified"] > post_a["last_modified"]
+    client.delete(f"/api/v1/posts/{post_b['id']}", headers=editor_headers)
+
+    body = client.get("/api/v1/posts/sync", params={"since": token}).json()
+    assert [post["title"] for post in body["posts"]] == ["Delta A edited"]
+    assert body["deleted_ids"] == [post_b["id"]]
+
+    # Unpublished posts disappear for anonymous clients
+    client.put(f"/api/v1/posts/{post_a['id']}", data={"status": PostStatus.DRAFT.value}, headers=editor_headers)
+    body = client.get("/api/v1/posts/sync", params={"since": body["next_token"]}).json()
+    assert body["posts"] == []
+    assert post_a["id"] in body["deleted_ids"]
+
+    # Drafts that were never public don't leak into anyone else's deletions
+    client.put(f"/api/v1/posts/{draft['id']}", data={"title": "Delta draft edited"}, headers=editor_headers)
+    for since in [body["next_token"], ""]:
+        assert draft["id"] not in client.get("/api/v1/posts/sync", params={"since": since}).json()["deleted_ids"]
+    assert draft["id"] in [post["id"] for post in client.get(
+        "/api/v1/posts/sync", params={"since": body["next_token"]}, headers=editor_headers
+    ).json()["posts"]]
+    client.delete(f"/api/v1/posts/{draft['id']}", headers=editor_headers)
+    assert draft["id"] not in client.get("/api/v1/posts/sync", params={"since": body["next_token"]}).json()["deleted_ids"]
+    assert draft["id"] in client.get(
+        "/api/v1/posts/sync", params={"since": body["next_token"]}, headers=editor_headers
+    ).json()["deleted_ids"]
+
+def test_delta_sync_invalid_token(client: TestClient):
+    response = client.get("/api/v1/posts/sync", params={"since": "garbage"})
+    assert response.status_code == 400
+
+
+# Search Tests
+def test_search_posts_bengali(client: TestClient, editor_headers: dict):
+    cat = create_category_helper(client, "Search Cat", headers=editor_headers).json()
+    # "নির্বাচন" typed with a zero-width non-joiner after the hasanta, digits in Bengali
+    create_post_helper(client, "জাতীয় নির্\u200cবাচন ২০২৪", "ঢাকায় আজ ভোটগ্রহণ শুরু হয়েছে।", [cat["id"]], cat["id"], editor_headers)
+    create_post_helper(client, "খেলার খবর", "ক্রিকেট দল <b>জয়ী</b> হয়েছে।", [cat["id"]], cat["id"], editor_headers)
+
+    response = client.get("/api/v1/posts/search", params={"q": "নির্বাচন 2024"})
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["post"]["title"] for r in results] == ["জাতীয় নির্\u200cবাচন ২০২৪"]
+
+    # Prefix match, highlighted and HTML-escaped snippet
+    results = client.get("/api/v1/posts/search", params={"q": "ক্রিকে"}).json()
+    assert len(results) == 1
+    assert results[0]["snippet"] == "<mark>ক্রিকেট</mark> দল &lt;b&gt;জয়ী&lt;/b&gt; হয়েছে।"
+    # Vowel signs are part of the word: "কিল" matches neither "ক্রিকেট" nor "কাল"
+    create_post_helper(client, "সময়", "কাল কুল", [cat["id"]], cat["id"], editor_headers)
+    assert client.get("/api/v1/posts/search", params={"q": "কিল"}).json() == []
+    assert [r["post"]["title"] for r in client.get("/api/v1/posts/search", params={"q": "কাল"}).json()] == ["সময়"]
+
+    # Edits are indexed at write time
+    client.put(f"/api/v1/posts/{results[0]['post']['id']}", data={"description": "ফুটবল"}, headers=editor_headers)
+    assert client.get("/api/v1/posts/search", params={"q": "ক্রিকেট"}).json() == []
+    assert len(client.get("/api/v1/posts/search", params={"q": "ফুটবল"}).json()) == 1
+
+
+# Response Cache Tests
+def test_anonymous_feed_cache_hits_and_invalidates(client: TestClient, editor_headers: dict):
+    cat = create_category_helper(client, "Cache Cat", headers=editor_headers).json()
+    post = create_post_helper(client, "Cached", "Body", [cat["id"]], cat["id"], editor_headers).json()
+
+    first = client.get("/api/v1/posts/", params={"limit": 1})
+    hits = feed_cache.stats()["hits"]
+    second = client.get("/api/v1/posts/", params={"limit": 1})
+    assert second.json() == first.json()
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+    assert feed_cache.stats()["hits"] == hits + 1
+
+    # A committed write clears cached responses
+    client.put(f"/api/v1/posts/{post['id']}", data={"title": "Cached edited"}, headers=editor_headers)
+    assert client.get("/api/v1/posts/", params={"limit": 1}).json()[0]["title"] == "Cached edited"
+    assert client.get(f"/api/v1/posts/{post['id']}").json()["title"] == "Cached edited"
+
+    # Authenticated reads bypass the cache
+    hits = feed_cache.stats()["hits"]
+    client.get("/api/v1/posts/", params={"limit": 1}, headers=editor_headers)
+    assert feed_cache.stats()["hits"] == hits
+
+    stats = client.get("/api/v1/system/cache").json()["feed_cache"]
+    assert stats["hits"] >= 1 and stats["invalidations"] >= 1
+
+
+# Conditional Request Tests
+def test_post_etag_revalidation_and_if_match(client: TestClient, editor_headers: dict):
+    cat = create_category_helper(client, "ETag Cat", headers=editor_headers).json()
+    post = create_post_helper(client, "Tagged", "Body", [cat["id"]], cat["id"], editor_headers).json()
+
+    response = client.get(f"/api/v1/posts/{post['id']}")
+    etag = response.headers["ETag"]
+    response = client.get(f"/api/v1/posts/{post['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    listing = client.get("/api/v1/posts/")
+    assert client.get("/api/v1/posts/", headers={"If-None-Match": listing.headers["ETag"]}).status_code == 304
+    categories = client.get("/api/v1/categories/")
+    assert client.get("/api/v1/categories/", headers={"If-None-Match": categories.headers["ETag"]}).status_code == 304
+
+    # Writes with a stale If-Match are rejected
+    response = client.put(
+        f"/api/v1/posts/{post['id']}", data={"title": "Tagged v2"}, headers={**editor_headers, "If-Match": etag}
+    )
+    assert response.status_code == 200
+    new_etag = response.headers["ETag"]
+    response = client.put(
+        f"/api/v1/posts/{post['id']}", data={"title": "Tagged v3"}, headers={**editor_headers, "If-Match": etag}
+    )
+    assert response.status_code == 412
+
+    # The old ETag no longer validates
+    response = client.get(f"/api/v1/posts/{post['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == new_etag
+
+
+# Category Tree Tests
+def test_category_tree_nests_counts_and_versions(client: TestClient, editor_headers: dict):
+    parent = create_category_helper(client, "Tree Parent", headers=editor_headers).json()
+    child = create_category_helper(client, "Tree Child", parent_id=parent["id"], headers=editor_headers).json()
+    create_post_helper(client, "Tree post", "Body", [child["id"]], parent["id"], editor_headers)
+
+    tree = client.get("/api/v1/categories/tree").json()
+    node = next(n for n in tree["categories"] if n["id"] == parent["id"])
+    assert node["post_count"] == 1
+    assert [sub["id"] for sub in node["subcategories"]] == [child["id"]]
+    # Subcategories count the published posts tagged with them
+    assert node["subcategories"][0]["post_count"] == 1
+
+    # Served from memory until a category write commits
+    assert count_queries(client, "/api/v1/categories/tree") == 0
+    assert client.get("/api/v1/categories/tree").json() == tree
+
+    client.put(f"/api/v1/categories/{child['id']}", json={"name": "Tree Child 2", "parent_id": parent["id"]}, headers=editor_headers)
+    updated = client.get("/api/v1/categories/tree").json()
+    assert updated["version"] != tree["version"]
+    node = next(n for n in updated["categories"] if n["id"] == parent["id"])
+    assert node["subcategories"][0]["name"] == "Tree Child 2"
+
+
+def test_category_tree_rejects_and_skips_cycles(client: TestClient, editor_headers: dict, session: Session):
+    parent = create_category_helper(client, "Loop Parent", headers=editor_headers).json()
+    child = create_category_helper(client, "Loop Child", parent_id=parent["id"], headers=editor_headers).json()
+    for parent_id in (parent["id"], child["id"]):
+        response = client.put(f"/api/v1/categories/{parent['id']}", json={"name": "Loop Parent", "parent_id": parent_id}, headers=editor_headers)
+        assert response.status_code == 400
+
+    # A loop written behind the API's back is left out instead of failing the whole tree
+    loop_parent = session.get(Category, parent["id"])
+    loop_parent.parent_id = child["id"]
+    session.commit()
+    standalone = create_category_helper(client, "Standalone", headers=editor_headers).json()
+    response = client.get("/api/v1/categories/tree")
+    assert response.status_code == 200
+    ids = [n["id"] for n in response.json()["categories"]]
+    assert standalone["id"] in ids and parent["id"] not in ids and child["id"] not in ids
+
+
+def test_create_post_resolves_topics_from_memory(client: TestClient, editor_headers: dict):
+    parent = create_category_helper(client, "Map Parent", headers=editor_headers).json()
+    topic = create_category_helper(client, "Map Topic", parent_id=parent["id"], headers=editor_headers).json()
+    create_post_helper(client, "Warm", "Body", [topic["id"]], parent["id"], editor_headers)
+
+    with QueryCounter() as counter:
+        response = create_post_helper(client, "Mapped", "Body", [topic["id"]], parent["id"], editor_headers)
+    assert response.status_code == 200
+    assert response.json()["category"]["id"] == parent["id"]
+    assert [t["id"] for t in response.json()["topics"]] == [topic["id"]]
+    before_insert = counter.statements[:next(i for i, sql in enumerate(counter.statements) if sql.startswith("INSERT INTO post "))]
+    assert not any("FROM category" in sql for sql in before_insert)
+
+    # Topics created after the map was built are picked up
+    other = create_category_helper(client, "Map Other", parent_id=parent["id"], headers=editor_headers).json()
+    post = response.json()
+    response = client.put(f"/api/v1/posts/{post['id']}", data={"topic_ids": [topic["id"], other["id"]]}, headers=editor_headers)
+    assert sorted(t["id"] for t in response.json()["topics"]) == sorted([topic["id"], other["id"]])
+    assert create_post_helper(client, "Bad", "Body", [999999], parent["id"], editor_headers).status_code == 400
+
+
+# Async Read Path Tests
+def test_async_comment_and_bookmark_listings(client: TestClient, editor_headers: dict):
+    cat = create_category_helper(client, "Async Cat", headers=editor_headers).json()
+    post = create_post_helper(client, "Async post", "Body", [cat["id"]], cat["id"], editor_headers).json()
+
+    response = client.post(f"/api/v1/posts/{post['id']}/comments", json={"content": "First"}, headers=editor_headers)
+    assert response.status_code == 200
+    comments = client.get(f"/api/v1/posts/{post['id']}/comments").json()
+    assert [(c["content"], c["author"]["username"]) for c in comments] == [("First", "editor")]
+
+    client.post("/api/v1/bookmarks/", json={"post_id": post["id"]}, headers=editor_headers)
+    bookmarks = client.get("/api/v1/bookmarks/", headers=editor_headers).json()
+    assert [b["post"]["title"] for b in bookmarks] == ["Async post"]
+    assert client.get("/api/v1/bookmarks/").status_code == 401
+
+
+# System Tests
+def test_db_pool_stats(client: TestClient):
+    stats = client.get("/api/v1/system/db-pool").json()
+    for name in ("sync", "async"):
+        assert stats[name]["pool"].startswith("Instrumented")
+        assert {"size", "checked_out", "idle", "overflow", "waits"} <= stats[name].keys()
+
+
+# Read Replica Tests
+def test_read_endpoints_route_to_fresh_replicas(client: TestClient, editor_headers: dict, monkeypatch):
+    replica = Replica(settings.db_url)
+    monkeypatch.setattr(replica_router, "replicas", [replica])
+    statements = []
+    for replica_engine in (replica.engine, replica.async_engine.sync_engine):
+        event.listen(replica_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    cat = create_category_helper(client, "Replica Cat", headers=editor_headers).json()
+    create_post_helper(client, "Replica post", "Body", [cat["id"]], cat["id"], editor_headers)
+    assert statements == []  # writes stay on the primary
+
+    assert [p["title"] for p in client.get("/api/v1/posts/", headers=editor_headers).json()] == ["Replica post"]
+    assert client.get(f"/api/v1/categories/{cat['id']}").status_code == 200
+    assert any("FROM post" in sql for sql in statements)
+    assert any("FROM category" in sql for sql in statements)
+
+    # A lagging replica is skipped until it catches up
+    statements.clear()
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG_SECONDS", -1.0)
+    replica.checked_at = float("-inf")
+    assert client.get("/api/v1/posts/", headers=editor_headers).status_code == 200
+    assert not any("FROM post" in sql for sql in statements)
+    assert client.get("/api/v1/system/db-pool").json()["replicas"][0]["usable"] is False
+
+
+# Auth Cache Tests
+def test_authenticated_reads_skip_user_lookup_and_honour_blocking(client: TestClient, session: Session, editor_headers: dict):
+    writer = create_admin_in_db(session, "cached_writer", "pass", AdminType.WRITER)
+    writer_headers = auth_headers(client, "cached_writer", "pass")
+    assert client.get("/api/v1/users/me", headers=writer_headers).status_code == 200
+
+    with QueryCounter() as counter:
+        assert client.get("/api/v1/posts/", headers=writer_headers).status_code == 200
+        assert client.get("/api/v1/users/me", headers=writer_headers).json()["username"] == "cached_writer"
+    assert not any("user.username =" in sql for sql in counter.statements)
+
+    response = client.patch(f"/api/v1/users/{writer.id}", json={"is_blocked": True}, headers=editor_headers)
+    assert response.status_code == 200
+    # The update committed on the async session; the shared sync test session still holds the old row
+    session.expire_all()
+    assert client.get("/api/v1/users/me", headers=writer_headers).status_code == 403
+    assert client.get("/api/v1/bookmarks/", headers=writer_headers).status_code == 403
+
+
+# Password Hashing Tests
+def test_login_rehashes_outdated_password_hashes(client: TestClient, session: Session):
+    user = create_admin_in_db(session, "legacy", "pass", AdminType.WRITER)
+    user.hashed_password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("pass")
+    session.add(user)
+    session.commit()
+
+    assert client.post("/api/v1/users/token", data={"username": "legacy", "password": "wrong"}).status_code == 401
+    response = client.post("/api/v1/users/token", data={"username": "legacy", "password": "pass"})
+    assert response.status_code == 200
+    session.refresh(user)
+    assert user.hashed_password.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+    assert client.post("/api/v1/users/token", data={"username": "legacy", "password": "pass"}).status_code == 200
+    assert client.get("/api/v1/system/password-hashing").json()["completed"] >= 3
+
+def test_login_rejected_when_hashing_pool_saturated(client: TestClient, session: Session, monkeypatch):
+    create_admin_in_db(session, "busy", "pass", AdminType.WRITER)
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(hashing_pool, "_slots", slots)
+    response = client.post("/api/v1/users/token", data={"username": "busy", "password": "pass"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+# Rate Limit Tests
+def test_sliding_window_counter():
+    decision, state = slide(None, 2, 60, 0)
+    assert decision.allowed and decision.remaining == 1
+    decision, state = slide(state, 2, 60, 1)
+    assert decision.allowed and decision.remaining == 0
+    decision, _ = slide(state, 2, 60, 2)
+    assert not decision.allowed and decision.retry_after == 58
+    # Halfway through the next window the previous one still counts for half
+    decision, state = slide(state, 2, 60, 90)
+    assert decision.allowed
+    decision, _ = slide(state, 2, 60, 91)
+    assert not decision.allowed
+
+def test_rate_limit_backends_share_and_bound_state(tmp_path):
+    memory = MemoryBackend(max_keys=2)
+    for client in ("a", "b", "c"):
+        memory.hit(client, 1, 60, 0)
+    assert not memory.hit("c", 1, 60, 1).allowed
+    assert memory.hit("a", 1, 60, 1).allowed  # evicted as least recently used
+
+    path = str(tmp_path / "limits.db")
+    worker_one, worker_two = SQLiteBackend(path, 100), SQLiteBackend(path, 100)
+    assert worker_one.hit("ip", 2, 60, 0).allowed
+    assert worker_two.hit("ip", 2, 60, 1).allowed
+    assert not worker_one.hit("ip", 2, 60, 2).allowed
+
+    # The async middleware path keeps SQLite I/O off the event loop thread
+    threads = []
+    class RecordingBackend(SQLiteBackend):
+        def hit(self, *args):
+            threads.append(threading.get_ident())
+            return super().hit(*args)
+    limiter = RateLimiter(RecordingBackend(path, 100), RateLimit("default", None, "/", 5, 60), [])
+    assert asyncio.run(limiter.check("GET", "/", "ip2", 0)).allowed
+    assert threads and threads[0] != threading.get_ident()
+    assert asyncio.run(RateLimiter(memory, limiter.default, []).check("GET", "/", "d", 0)).allowed
+
+def test_per_route_rate_limit(client: TestClient):
+    rule = rate_limiter.rule_for("POST", "/api/v1/users/token")
+    for _ in range(rule.limit):
+        client.post("/api/v1/users/token", data={"username": "nobody", "password": "x"})
+    response = client.post("/api/v1/users/token", data={"username": "nobody", "password": "x"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # Other routes keep their own budget
+    response = client.get("/api/v1/categories/")
+    assert response.status_code == 200
+    assert int(response.headers["X-RateLimit-Remaining"]) == rate_limiter.default.limit - 1
+
+def test_signup_only_queues_verification_email(client: TestClient, session: Session, monkeypatch):
+    monkeypatch.setattr(smtplib, "SMTP", None)  # any delivery attempt in the request would fail
+    response = client.post(
+        "/api/v1/users/signup",
+        json={"username": "newreader", "email": "reader@example.com", "password": "secret"},
+    )
+    assert response.status_code == 200
+    queued = session.exec(select(EmailOutbox)).all()
+    assert [(email.to_email, email.status) for email in queued] == [("reader@example.com", EmailStatus.PENDING)]
+
+def test_password_endpoints_hash_in_the_pool_without_threadpool(client: TestClient, editor_headers: dict, session: Session):
+    completed = hashing_pool.stats()["completed"]
+    response = client.post("/api/v1/users/", json={"username": "made", "password": "first"}, headers=editor_headers)
+    assert response.status_code == 200
+    made_id = response.json()["id"]
+    assert client.patch(f"/api/v1/users/{made_id}", json={"password": "second"}, headers=editor_headers).status_code == 200
+    session.expire_all()
+    assert pwd_context.verify("second", session.get(User, made_id).hashed_password)
+
+    editor = session.exec(select(User).where(User.username == "editor")).one()
+    editor.email = "editor@example.com"
+    session.commit()
+    user_cache.clear()
+    assert client.post("/api/v1/users/reset-password-request", headers=editor_headers).status_code == 200
+    code = session.exec(select(User.verification_code).where(User.username == "editor")).one()
+    assert client.post("/api/v1/users/reset-password-confirm", json={"code": "wrong", "new_password": "x"}, headers=editor_headers).status_code == 400
+    response = client.post("/api/v1/users/reset-password-confirm", json={"code": code, "new_password": "renewed"}, headers=editor_headers)
+    assert response.status_code == 200
+    assert client.post("/api/v1/users/token", data={"username": "editor", "password": "renewed"}).status_code == 200
+    assert hashing_pool.stats()["completed"] >= completed + 3
+
+class SMTPInbox:
+    """aiosmtpd handler recording delivered recipients; bounce@ addresses are refused."""
+
+    def __init__(self):
+        self.recipients = []
+        self.messages = []
+
+    async def handle_RCPT(self, server, smtp_session, envelope, address, rcpt_options):
+        if address.startswith("bounce@"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, smtp_session, envelope):
+        self.recipients.extend(envelope.rcpt_tos)
+        self.messages.append(envelope.content)
+        return "250 Message accepted"
+
+@pytest.fixture(name="smtp_server")
+def smtp_server_fixture():
+    controller_module = pytest.importorskip("aiosmtpd.controller")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    inbox = SMTPInbox()
+    controller = controller_module.Controller(inbox, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield inbox, port
+    controller.stop()
+
+def test_outbox_batches_over_one_connection_with_retries(session: Session, smtp_server):
+    inbox, port = smtp_server
+    connection = SMTPConnection("127.0.0.1", port, starttls=False)
+    for i in range(3):
+        enqueue_email(session, f"reader{i}@example.com", "Hello", "<p>Hi</p>")
+    enqueue_email(session, "bounce@example.com", "Hello", "<p>Hi</p>")
+    session.commit()
+
+    counts = process_outbox(session, connection, batch_size=10)
+    assert counts == {"claimed": 4, "sent": 3, "retried": 0, "failed": 1}
+    assert sorted(inbox.recipients) == [f"reader{i}@example.com" for i in range(3)]
+    assert connection.connects == 1
+    bounced = session.exec(select(EmailOutbox).where(EmailOutbox.to_email == "bounce@example.com")).one()
+    assert bounced.status == EmailStatus.FAILED and "550" in bounced.last_error
+
+    # Server gone: the message is rescheduled with backoff rather than lost
+    connection.close()
+    connection.port = 1
+    queued = enqueue_email(session, "later@example.com", "Hello", "<p>Hi</p>")
+    session.commit()
+    counts = process_outbox(session, connection, batch_size=10)
+    assert counts["retried"] == 1
+    session.refresh(queued)
+    assert queued.status == EmailStatus.PENDING and queued.attempts == 1
+    assert queued.next_attempt_at > datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.EMAIL_RETRY_BASE - 5)
+    assert process_outbox(session, connection)["claimed"] == 0
+
+def test_outbox_concurrent_claimers_never_share_a_message(session: Session):
+    queued = [enqueue_email(session, f"race{i}@example.com", "Hello", "<p>Hi</p>") for i in range(4)]
+    session.commit()
+
+    # Both claimers read the due rows before either writes its lease
+    read_both = threading.Barrier(2, timeout=5)
+    def wait_for_other_reader(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM emailoutbox" in statement:
+            read_both.wait()
+    claims = {}
+    def claim(name):
+        with Session(engine) as claimer:
+            claims[name] = [email.id for email in claim_due_emails(claimer, 100)]
+
+    event.listen(engine, "after_cursor_execute", wait_for_other_reader)
+    try:
+        claimers = [threading.Thread(target=claim, args=(name,)) for name in ("a", "b")]
+        for claimer in claimers:
+            claimer.start()
+        for claimer in claimers:
+            claimer.join(10)
+    finally:
+        event.remove(engine, "after_cursor_execute", wait_for_other_reader)
+    assert not set(claims["a"]) & set(claims["b"])
+    assert {email.id for email in queued} <= set(claims["a"]) | set(claims["b"])
+    attempts = session.exec(select(EmailOutbox.attempts).where(EmailOutbox.to_email.like("race%"))).all()
+    assert attempts == [1, 1, 1, 1]
+
+def test_newsletter_digest_resumes_and_defers_failures(session: Session, smtp_server):
+    inbox, port = smtp_server
+    day = datetime.datetime.utcnow().date() - datetime.timedelta(days=1)
+    published_at = datetime.datetime.combine(day, datetime.time(12))
+    author = User(username="digest-author", hashed_password="x")
+    politics = Category(name="Politics")
+    session.add_all([author, politics])
+    session.commit()
+    session.add_all([
+        Post(title="Election <results>", description="Counted", status=PostStatus.PUBLISHED,
+             author_id=author.id, category_id=politics.id, created_at=published_at),
+        Post(title="Uncategorised", description="Misc", status=PostStatus.PUBLISHED,
+             author_id=author.id, created_at=published_at),
+        Post(title="Still a draft", description="x", status=PostStatus.DRAFT,
+             author_id=author.id, created_at=published_at),
+        Post(title="Published today", description="x", status=PostStatus.PUBLISHED, author_id=author.id),
+    ])
+    subscribers = [
+        User(username=f"sub{i}", email=email, hashed_password="x", newsletter_subscribed=True, is_verified=True)
+        for i, email in enumerate(["a@example.com", "b@example.com", "bounce@example.com", "c@example.com"])
+    ]
+    session.add_all(subscribers + [
+        User(username="unsubscribed", email="u@example.com", hashed_password="x", is_verified=True),
+        User(username="unverified", email="v@example.com", hashed_password="x", newsletter_subscribed=True),
+    ])
+    session.commit()
+
+    # A previous worker rendered the digest and sent the first batch before dying
+    with Session(engine) as other:
+        run = start_run(other, day)
+        run.last_user_id = subscribers[0].id
+        run.updated_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        other.add(run)
+        other.commit()
+
+    pool = SMTPPool(2, rate=0, connection_factory=lambda: SMTPConnection("127.0.0.1", port, starttls=False))
+    try:
+        run = send_digest(engine, day, pool=pool, batch_size=2)
+    finally:
+        pool.close()
+    assert run.completed and run.sent_count == 2 and run.deferred_count == 1
+    assert sorted(inbox.recipients) == ["b@example.com", "c@example.com"]
+    assert "Election &lt;results&gt;" in run.html_content and "Politics" in run.html_content
+    assert "Uncategorised" in run.html_content
+    assert "Still a draft" not in run.html_content and "Published today" not in run.html_content
+    assert session.exec(select(EmailOutbox.to_email)).all() == ["bounce@example.com"]
+    # Finished runs are not sent again
+    assert send_digest(engine, day) is None
+
+
+# Image Tests
+def test_uploaded_images_get_variants_off_the_request_path(client: TestClient, editor_headers: dict, tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "static" / "images").mkdir(parents=True)
+    pipeline = ImagePipeline(workers=1, use_processes=False)
+    pipeline.widths, pipeline.formats = [320, 640, 4000], ["webp"]
+    queued = []
+    submit = pipeline.submit
+    monkeypatch.setattr(pipeline, "submit", lambda *args: queued.append(submit(*args)) or queued[-1])
+    monkeypatch.setattr(posts_api, "image_pipeline", pipeline)
+
+    photo = tmp_path / "photo.jpg"
+    exif = Image.Exif()
+    exif[0x010F] = "Camera Maker"
+    Image.new("RGB", (1000, 500), "red").save(photo, exif=exif)
+    cat = create_category_helper(client, "Photos", headers=editor_headers).json()
+    post = create_post_helper(client, "Photo", "Desc", [cat["id"]], cat["id"], editor_headers, image_path=str(photo)).json()
+
+    queued[0].result(timeout=30)
+    variants = client.get(f"/api/v1/posts/{post['id']}").json()["image_variants"]
+    assert [(v["width"], v["format"]) for v in variants] == [(320, "webp"), (640, "webp")]
+    with Image.open(tmp_path / variants[0]["url"]) as thumbnail:
+        assert thumbnail.size == (320, 160)
+        assert not thumbnail.getexif()
+
+    # Replacing the image rebuilds the variants; undecodable uploads end up with none
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    with broken.open("rb") as upload:
+        response = client.put(
+            f"/api/v1/posts/{post['id']}", files={"image": ("broken.jpg", upload, "image/jpeg")}, headers=editor_headers
+        )
+    assert response.status_code == 200
+    queued[1].result(timeout=30)
+    assert client.get(f"/api/v1/posts/{post['id']}").json()["image_variants"] == []
+
+def test_image_uploads_are_content_addressed_and_deduplicated(client: TestClient, editor_headers: dict, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pipeline = ImagePipeline(workers=1, use_processes=False)
+    queued = []
+    submit = pipeline.submit
+    monkeypatch.setattr(pipeline, "submit", lambda *args: queued.append(submit(*args)) or queued[-1])
+    monkeypatch.setattr(posts_api, "image_pipeline", pipeline)
+    photo = tmp_path / "wire.JPEG"
+    photo.write_bytes(b"the same wire photo")
+    digest = hashlib.sha256(b"the same wire photo").hexdigest()
+    cat = create_category_helper(client, "Wire", headers=editor_headers).json()
+
+    first = create_post_helper(client, "First", "Desc", [cat["id"]], cat["id"], editor_headers, image_path=str(photo)).json()
+    assert first["image"] == f"static/images/{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+    queued[0].result(timeout=30)
+    second = create_post_helper(client, "Second", "Desc", [cat["id"]], cat["id"], editor_headers, image_path=str(photo)).json()
+    # Same file, and its variants are reused instead of rebuilt
+    assert second["image"] == first["image"]
+    assert second["image_variants"] == [] and len(queued) == 1
+    assert [p.name for p in (tmp_path / "static" / "images").rglob("*") if p.is_file()] == [f"{digest}.jpg"]
+
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", 10)
+    response = create_post_helper(client, "Too big", "Desc", [cat["id"]], cat["id"], editor_headers, image_path=str(photo))
+    assert response.status_code == 413
+    assert not any((tmp_path / "static" / "images" / ".incoming").iterdir())
+
+def test_oversized_request_bodies_rejected_while_streaming():
+    inner = FastAPI()
+
+    @inner.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    limited = TestClient(BodySizeLimitMiddleware(inner, max_bytes=10))
+    assert limited.post("/upload", content=b"x" * 10).json() == {"size": 10}
+    assert limited.post("/upload", content=b"x" * 11).status_code == 413
+    # Without a Content-Length the body is counted as it arrives
+    assert limited.post("/upload", content=iter([b"x" * 6, b"x" * 6])).status_code == 413
+
+
+# Static File Tests
+def test_static_files_cache_headers_ranges_and_precompressed(tmp_path):
+    digest = hashlib.sha256(b"photo").hexdigest()
+    hashed = tmp_path / "images" / digest[:2] / digest[2:4] / f"{digest}-320w.webp"
+    hashed.parent.mkdir(parents=True)
+    hashed.write_bytes(b"0123456789")
+    style = tmp_path / "site.css"
+    style.write_text("body { color: red; }\n" * 200)
+    assert precompress(tmp_path) == [tmp_path / "site.css.gz"]
+    static = FastAPI()
+    static.mount("/static", CachedStaticFiles(directory=tmp_path, max_age=60))
+    static_client = TestClient(static)
+
+    response = static_client.get(f"/static/images/{digest[:2]}/{digest[2:4]}/{hashed.name}", headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206 and response.content == b"2345"
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    etag = response.headers["ETag"]
+    response = static_client.get(f"/static/images/{digest[:2]}/{digest[2:4]}/{hashed.name}", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and "immutable" in response.headers["Cache-Control"]
+
+    response = static_client.get("/static/site.css", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip" and response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["Content-Type"].startswith("text/css")
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+    assert response.text == style.read_text()
+    response = static_client.get("/static/site.css", headers={"Accept-Encoding": "identity, gzip;q=0"})
+    assert "Content-Encoding" not in response.headers
+    assert int(response.headers["Content-Length"]) == style.stat().st_size
+
+
+# Scheduled Publishing Tests
+def test_scheduled_posts_publish_in_one_update_and_arm_exact_timer(client: TestClient, editor_headers: dict, session: Session):
+    scheduler = BackgroundScheduler()
+    scheduler.start(paused=True)  # jobs are armed but never run
+    publish_timer.attach(scheduler, lambda: None)
+    try:
+        cat = create_category_helper(client, "Embargo", headers=editor_headers).json()
+        due_at = (datetime.datetime.utcnow() + datetime.timedelta(minutes=5)).replace(microsecond=0)
+        for title, minutes in (("Later", 10), ("Soonest", 5)):
+            response = client.post(
+                "/api/v1/posts/",
+                data={"title": title, "description": "Desc", "topic_ids": [cat["id"]], "category_id": cat["id"],
+                      "scheduled_at": (due_at + datetime.timedelta(minutes=minutes - 5)).isoformat()},
+                headers=editor_headers,
+            )
+            assert response.json()["status"] == PostStatus.SCHEDULED.value
+        # Armed for the earliest schedule, to the second
+        assert publish_timer.armed_for() == due_at.replace(tzinfo=datetime.timezone.utc)
+
+        feed = client.get("/api/v1/posts/sync").json()
+        assert feed["posts"] == [] and feed["category_counts"] == {}
+        counter = QueryCounter()
+        event.listen(engine, "before_cursor_execute", counter._before_execute)
+        try:
+            published = publish_due_posts(session, due_at + datetime.timedelta(seconds=1))
+        finally:
+            event.remove(engine, "before_cursor_execute", counter._before_execute)
+        assert len(published) == 1
+        assert sum(statement.lstrip().upper().startswith("UPDATE POST") for statement in counter.statements) == 1
+        # Counts and cached feeds follow the bulk update
+        feed = client.get("/api/v1/posts/sync").json()
+        assert [post["title"] for post in feed["posts"]] == ["Soonest"]
+        assert feed["category_counts"] == {str(cat["id"]): 1}
+        assert next_due_at(session) == due_at + datetime.timedelta(minutes=5)
+    finally:
+        publish_timer.attach(None, None)
+        scheduler.shutdown(wait=False)
+
+
+def test_scheduling_on_a_follower_wakes_the_leader(tmp_path, monkeypatch):
+    path = str(tmp_path / "scheduler.wakeup")
+    leader, follower = FileWakeup(path, 0.05), FileWakeup(path, 0.05)
+    monkeypatch.setattr(publishing_module, "publish_wakeup", follower)
+    woken = threading.Event()
+    leader.start(woken.set)
+    try:
+        threading.Event().wait(0.1)  # let the listener take its first look
+        # No timer in this worker: the leader is woken instead
+        publishing_module.schedule_publishing(datetime.datetime.utcnow() + datetime.timedelta(minutes=5))
+        assert woken.wait(5)
+    finally:
+        leader.stop()
+
+
+# Scheduler Leader Election Tests
+def test_scheduler_leader_election_hands_over_on_stop(tmp_path):
+    lock_path = str(tmp_path / "scheduler.lock")
+    events = []
+    workers = [
+        LeaderElection(FileLock(lock_path), lambda i=i: events.append(("elected", i)),
+                       lambda i=i: events.append(("deposed", i)), retry_interval=0.05)
+        for i in range(2)
+    ]
+    # Each election holds its own descriptor, so they contend like separate processes
+    workers[0].identity, workers[1].identity = "web-1:100", "web-2:200"
+    try:
+        workers[0].step()
+        workers[1].step()
+        assert events == [("elected", 0)]
+        assert [worker.is_leader for worker in workers] == [True, False]
+        assert workers[1].status() == {"worker": "web-2:200", "is_leader": False, "leader": "web-1:100", "lock": "file-lock"}
+
+        workers[1].start()
+        workers[0].stop()
+        for _ in range(100):
+            if workers[1].is_leader:
+                break
+            threading.Event().wait(0.05)
+        assert events == [("elected", 0), ("deposed", 0), ("elected", 1)]
+        assert workers[0].status()["leader"] == "web-2:200"
+    finally:
+        for worker in workers:
+            worker.stop()
+    assert events[-1] == ("deposed", 1)
+    assert FileLock(lock_path).leader() is None
+
+
+def test_scheduler_runs_jobs_again_after_reelection(monkeypatch):
+    ran = threading.Event()
+    monkeypatch.setattr(scheduler_module, "scheduler", BackgroundScheduler())
+    monkeypatch.setattr(scheduler_module, "publish_scheduled_posts", ran.set)
+    election = LeaderElection(SoleWorker(), scheduler_module._start_jobs, scheduler_module._stop_jobs, retry_interval=0.05)
+    try:
+        election.step()
+        assert ran.wait(5)
+        # Losing the lock pauses the scheduler and drops its jobs
+        election.lock.release()
+        election.step()
+        assert not scheduler_module.scheduler_running()
+        assert scheduler_module.scheduler.get_jobs() == []
+        assert publish_timer.scheduler is None
+        # Re-elected in the same process: jobs run again
+        ran.clear()
+        election.step()
+        assert election.is_leader and scheduler_module.scheduler_running()
+        assert ran.wait(5)
+    finally:
+        election.stop()
+        scheduler_module.scheduler.shutdown(wait=False)
+        publish_timer.attach(None, None)
+
+
+def test_scheduler_health_reports_leader(client: TestClient):
+    response = client.get("/health/scheduler")
+    assert response.status_code == 200
+    data = response.json()
+    # The test client does not run the lifespan, so this worker never campaigned
+    assert data["is_leader"] is False and data["scheduler_running"] is False
+    assert data["worker"].endswith(f":{os.getpid()}")
+    assert data["lock"] in ("file-lock", "postgres-advisory-lock", "none")
+
+
+# Live Post Stream Tests
+async def next_event(frames):
+    """Next SSE frame parsed into a dict of its fields, skipping heartbeats."""
+    while True:
+        frame = await asyncio.wait_for(frames.__anext__(), 5)
+        if not frame.startswith(":"):
+            return dict(line.split(": ", 1) for line in frame.strip().splitlines())
+
+
+def test_post_stream_pushes_filtered_changes_and_resumes(client: TestClient, editor_headers: dict):
+    cat_a = create_category_helper(client, "Live A", headers=editor_headers).json()
+    cat_b = create_category_helper(client, "Live B", headers=editor_headers).json()
+    feed = PostChangeFeed(poll_interval=0.05, heartbeat=0.05, max_clients=2, max_pending=8, backfill_limit=50)
+
+    async def scenario():
+        everyone = feed.subscribe(async_engine, load_options=posts_api.POST_READ_OPTIONS)
+        only_b = feed.subscribe(async_engine, categories=[cat_b["id"]], full=True, load_options=posts_api.POST_READ_OPTIONS)
+        with pytest.raises(Exception):
+            feed.subscribe(async_engine)  # max_clients reached
+        all_frames, b_frames = feed.stream(everyone), feed.stream(only_b)
+        assert (await all_frames.__anext__()).startswith("retry:")
+        assert (await b_frames.__anext__()).startswith("retry:")
+        # A heartbeat while nothing changes
+        assert await asyncio.wait_for(all_frames.__anext__(), 5) == ": ping\n\n"
+
+        post_a = create_post_helper(client, "In A", "Desc", [cat_a["id"]], cat_a["id"], editor_headers).json()
+        post_b = create_post_helper(client, "In B", "Desc", [cat_b["id"]], cat_b["id"], editor_headers).json()
+
+        first = await next_event(all_frames)
+        assert first["event"] == "post" and json.loads(first["data"])["id"] == post_a["id"]
+        assert json.loads(first["data"])["topic_ids"] == [cat_a["id"]]
+        assert json.loads((await next_event(all_frames))["data"])["id"] == post_b["id"]
+        # The filtered client only sees B, with the full post
+        filtered = await next_event(b_frames)
+        assert json.loads(filtered["data"])["title"] == "In B"
+
+        client.delete(f"/api/v1/posts/{post_b['id']}", headers=editor_headers)
+        deleted = await next_event(all_frames)
+        assert deleted["event"] == "delete" and json.loads(deleted["data"]) == {"id": post_b["id"]}
+
+        await all_frames.aclose()
+        await b_frames.aclose()
+        assert feed.subscribers == set()
+
+        # Reconnecting with Last-Event-ID replays the changes after it
+        resumed = feed.subscribe(async_engine, load_options=posts_api.POST_READ_OPTIONS)
+        frames = feed.stream(resumed, decode_cursor(first["id"]))
+        await frames.__anext__()
+        replayed = [await next_event(frames) for _ in range(2)]
+        await frames.aclose()
+        return post_a, post_b, replayed
+
+    post_a, post_b, replayed = asyncio.run(scenario())
+    assert [(event["event"], json.loads(event["data"])["id"]) for event in replayed] == [
+        ("post", post_a["id"]), ("delete", post_b["id"])
+    ]
+
+
+def test_post_stream_only_deletes_posts_the_client_saw():
+    now = datetime.datetime.utcnow()
+    anonymous = Subscriber([], lambda post: post.status == PostStatus.PUBLISHED, lambda author_id: False, False, 8)
+    author = Subscriber([], lambda post: True, lambda author_id: author_id == 7, False, 8)
+
+    def event_type(subscriber, change):
+        frame = subscriber.render(change)
+        return frame and dict(line.split(": ", 1) for line in frame.strip().splitlines())["event"]
+
+    draft = Post(id=1, title="Draft", author_id=7, status=PostStatus.DRAFT, last_modified=now)
+    unpublished = Post(id=2, title="Pulled", author_id=7, status=PostStatus.DRAFT, last_modified=now, unpublished_at=now)
+    edited_after = Post(
+        id=3, title="Pulled earlier", author_id=7, status=PostStatus.DRAFT,
+        last_modified=now, unpublished_at=now - datetime.timedelta(minutes=1),
+    )
+    # Saving a draft, or editing a post that was pulled earlier, tells readers nothing
+    assert event_type(anonymous, PostChange((now, 1), 1, draft)) is None
+    assert event_type(anonymous, PostChange((now, 3), 3, edited_after)) is None
+    assert event_type(anonymous, PostChange((now, 2), 2, unpublished)) == "delete"
+    assert event_type(author, PostChange((now, 1), 1, draft)) == "post"
+    # Deleting a draft only reaches those who could see it
+    tombstone = PostChange((now, 1), 1, was_published=False, author_id=7)
+    assert event_type(anonymous, tombstone) is None
+    assert event_type(author, tombstone) == "delete"
+    assert event_type(anonymous, PostChange((now, 4), 4, was_published=True, author_id=7)) == "delete"
+
+
+def test_post_stream_rejects_invalid_last_event_id(client: TestClient):
+    response = client.get("/api/v1/posts/stream", headers={"Last-Event-ID": "not-a-token"})
+    assert response.status_code == 400
+
+
+# Comment Pagination Tests
+def test_comments_paginate_with_batched_authors_and_counts(client: TestClient, editor_headers: dict, session: Session):
+    create_admin_in_db(session, "commenter", "pass", AdminType.WRITER)
+    commenter_headers = auth_headers(client, "commenter", "pass")
+    cat = create_category_helper(client, "Talk", headers=editor_headers).json()
+    post = create_post_helper(client, "Talked about", "Body", [cat["id"]], cat["id"], editor_headers).json()
+    assert post["comments_count"] == 0
+    for i, headers in enumerate([editor_headers, commenter_headers, editor_headers]):
+        response = client.post(f"/api/v1/posts/{post['id']}/comments", json={"content": f"C{i}"}, headers=headers)
+        assert response.status_code == 200
+    assert client.get(f"/api/v1/posts/{post['id']}").json()["comments_count"] == 3
+
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        response = client.get(f"/api/v1/posts/{post['id']}/comments?limit=2")
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    # One query for the page and one for all of its authors
+    assert len(statements) == 2
+    page = response.json()
+    assert [(c["content"], c["author"]["username"]) for c in page] == [("C2", "editor"), ("C1", "commenter")]
+
+    rest = client.get(f"/api/v1/posts/{post['id']}/comments?limit=2&cursor={response.headers['X-Next-Cursor']}")
+    assert [c["content"] for c in rest.json()] == ["C0"]
+    assert "X-Next-Cursor" not in rest.headers
+    assert client.get(f"/api/v1/posts/{post['id']}/comments?cursor=bad").status_code == 400
+
+    # Deleting a comment keeps the count in step without touching last_modified
+    last_modified = client.get(f"/api/v1/posts/{post['id']}").json()["last_modified"]
+    client.delete(f"/api/v1/posts/comments/{page[0]['id']}", headers=editor_headers)
+    feed_cache.clear()
+    reread = client.get(f"/api/v1/posts/{post['id']}").json()
+    assert reread["comments_count"] == 2 and reread["last_modified"] == last_modified
+
+    # Drift from raw SQL is repaired by the reconcile job
+    session.execute(Post.__table__.update().values(comments_count=7))
+    session.commit()
+    assert reconcile_comment_counts(session) == 1
+    session.expire_all()
+    assert session.get(Post, post["id"]).comments_count == 2
+
+
+# Bookmark Sync Tests
+def test_bookmark_sync_merges_in_one_insert(client: TestClient, editor_headers: dict):
+    cat = create_category_helper(client, "Saved", headers=editor_headers).json()
+    posts = [create_post_helper(client, f"Saved {i}", "Body", [cat["id"]], cat["id"], editor_headers).json() for i in range(3)]
+    client.post("/api/v1/bookmarks/", json={"post_id": posts[0]["id"]}, headers=editor_headers)
+
+    counter = QueryCounter()
+    with counter:
+        response = client.post(
+            "/api/v1/bookmarks/sync",
+            json=[posts[0]["id"], posts[1]["id"], posts[1]["id"], posts[2]["id"], 999999],
+            headers=editor_headers,
+        )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message"] == "Synced 2 bookmarks"
+    assert data["post_ids"] == sorted(post["id"] for post in posts)
+    assert data["missing_ids"] == [999999]
+    # The merge itself is one INSERT ... SELECT, whatever the number of ids
+    assert sum(statement.lstrip().upper().startswith("INSERT INTO BOOKMARK") for statement in counter.statements) == 1
+
+    # Syncing again is a no-op
+    again = client.post("/api/v1/bookmarks/sync", json=[posts[2]["id"]], headers=editor_headers).json()
+    assert again["message"] == "Synced 0 bookmarks" and again["post_ids"] == data["post_ids"]
+    assert len(client.get("/api/v1/bookmarks/", headers=editor_headers).json()) == 3